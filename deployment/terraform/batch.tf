@@ -62,6 +62,7 @@ data "template_file" "default_job_definition" {
     environment              = "${var.environment}"
     django_secret_key        = "${var.django_secret_key}"
     google_geocoding_api_key = "${var.google_geocoding_api_key}"
+    aws_storage_bucket_name  = "${aws_s3_bucket.uploads.id}"
 
     rollbar_client_side_access_token = "${var.rollbar_client_side_access_token}"
   }
@@ -119,6 +119,8 @@ data "template_file" "app" {
 
     default_from_email = "${var.default_from_email}"
 
+    aws_storage_bucket_name = "${aws_s3_bucket.uploads.id}"
+
     app_port = "${var.app_port}"
 
     aws_region = "${var.aws_region}"
@@ -164,6 +166,8 @@ data "template_file" "app_cli" {
 
     default_from_email = "${var.default_from_email}"
 
+    aws_storage_bucket_name = "${aws_s3_bucket.uploads.id}"
+
     app_port = "${var.app_port}"
 
     aws_region = "${var.aws_region}"
@@ -216,6 +220,40 @@ resource "aws_ecs_service" "app" {
 #
 # CloudWatch Resources
 #
+resource "aws_cloudwatch_event_rule" "recover_facility_list_ingestion" {
+  name                = "rule${var.environment}RecoverFacilityListIngestion"
+  description         = "Resolve facility lists whose ingestion has stalled"
+  schedule_expression = "${var.recover_facility_list_ingestion_schedule_expression}"
+}
+
+resource "aws_cloudwatch_event_target" "recover_facility_list_ingestion" {
+  rule     = "${aws_cloudwatch_event_rule.recover_facility_list_ingestion.name}"
+  arn      = "${aws_ecs_cluster.app.arn}"
+  role_arn = "${aws_iam_role.events_ecs.arn}"
+
+  ecs_target {
+    launch_type         = "FARGATE"
+    task_count          = 1
+    task_definition_arn = "${aws_ecs_task_definition.app_cli.arn}"
+
+    network_configuration {
+      security_groups = ["${aws_security_group.app.id}"]
+      subnets         = ["${module.vpc.private_subnet_ids}"]
+    }
+  }
+
+  input = <<EOF
+{
+  "containerOverrides": [
+    {
+      "name": "django",
+      "command": ["recoverfacilitylistingestion"]
+    }
+  ]
+}
+EOF
+}
+
 resource "aws_cloudwatch_log_group" "app" {
   name              = "log${var.environment}App"
   retention_in_days = 30
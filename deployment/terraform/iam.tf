@@ -67,6 +67,78 @@ resource "aws_iam_role_policy" "batch_describe_and_submit" {
   policy = "${data.aws_iam_policy_document.batch_describe_and_submit.json}"
 }
 
+data "aws_iam_policy_document" "uploads_read_write" {
+  statement {
+    effect = "Allow"
+
+    resources = ["${aws_s3_bucket.uploads.arn}/*"]
+    actions = [
+      "s3:GetObject",
+      "s3:PutObject",
+      "s3:DeleteObject",
+    ]
+  }
+
+  statement {
+    effect = "Allow"
+
+    resources = ["${aws_s3_bucket.uploads.arn}"]
+    actions   = ["s3:ListBucket"]
+  }
+}
+
+resource "aws_iam_role_policy" "uploads_read_write" {
+  name   = "S3UploadsReadWrite"
+  role   = "${aws_iam_role.app_task_role.name}"
+  policy = "${data.aws_iam_policy_document.uploads_read_write.json}"
+}
+
+#
+# CloudWatch Events IAM resources
+#
+data "aws_iam_policy_document" "events_assume_role" {
+  statement {
+    effect = "Allow"
+
+    principals {
+      type        = "Service"
+      identifiers = ["events.amazonaws.com"]
+    }
+
+    actions = ["sts:AssumeRole"]
+  }
+}
+
+resource "aws_iam_role" "events_ecs" {
+  name               = "events${var.environment}EcsRole"
+  assume_role_policy = "${data.aws_iam_policy_document.events_assume_role.json}"
+}
+
+data "aws_iam_policy_document" "events_run_task" {
+  statement {
+    effect = "Allow"
+
+    resources = ["${aws_ecs_task_definition.app_cli.arn}"]
+    actions   = ["ecs:RunTask"]
+  }
+
+  statement {
+    effect = "Allow"
+
+    resources = [
+      "${aws_iam_role.app_task_role.arn}",
+      "${aws_iam_role.ecs_task_execution_role.arn}",
+    ]
+
+    actions = ["iam:PassRole"]
+  }
+}
+
+resource "aws_iam_role_policy" "events_run_task" {
+  name   = "EventsRunTask"
+  role   = "${aws_iam_role.events_ecs.name}"
+  policy = "${data.aws_iam_policy_document.events_run_task.json}"
+}
 
 #
 # EC2 IAM resources
@@ -9,6 +9,30 @@ resource "aws_s3_bucket" "logs" {
   }
 }
 
+resource "aws_s3_bucket" "uploads" {
+  bucket = "${lower(replace(var.project, " ", ""))}-${lower(var.environment)}-uploads-${var.aws_region}"
+  acl    = "private"
+
+  # Uploaded facility lists are deleted once they have been ingested or have
+  # failed. Expire any that are left behind, well after
+  # recoverfacilitylistingestion has resolved the list they belong to.
+  lifecycle_rule {
+    id      = "expire-facility-lists"
+    enabled = true
+    prefix  = "facility_lists/"
+
+    expiration {
+      days = "${var.uploads_expiration_days}"
+    }
+  }
+
+  tags {
+    Name        = "${lower(replace(var.project, " ", ""))}-${lower(var.environment)}-uploads-${var.aws_region}"
+    Project     = "${var.project}"
+    Environment = "${var.environment}"
+  }
+}
+
 module "ecr_repository_app" {
   source = "github.com/azavea/terraform-aws-ecr-repository?ref=0.1.0"
 
@@ -64,6 +64,14 @@ variable "django_secret_key" {}
 
 variable "default_from_email" {}
 
+variable "uploads_expiration_days" {
+  default = "7"
+}
+
+variable "recover_facility_list_ingestion_schedule_expression" {
+  default = "rate(15 minutes)"
+}
+
 variable "app_count" {
   default = "1"
 }
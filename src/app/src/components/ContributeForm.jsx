@@ -186,7 +186,7 @@ class ContributeForm extends Component {
                     </p>
                     <input
                         type="file"
-                        accept=".csv"
+                        accept=".csv,.gz,.zip"
                         ref={this.fileInput}
                         style={contributeFormStyles.fileInputHidden}
                         onChange={this.updateSelectedFileName}
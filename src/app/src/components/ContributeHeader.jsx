@@ -28,7 +28,9 @@ const ContributeHeader = memo(() => (
                         sew, RMG, embellishments and printing.
                     </li>
                     <li className="helper-list__item">
-                        File size limit: 5MB
+                        File size limit: 500MB. The file can be
+                        compressed as a .gz or single-file .zip
+                        archive to upload it faster.
                     </li>
                     <li className="helper-list__item">
                         Save your file as a CSV file:{' '}
@@ -19,3 +19,5 @@ admin.site.register(models.FacilityList)
 admin.site.register(models.FacilityListItem)
 admin.site.register(models.Facility)
 admin.site.register(models.FacilityMatch)
+admin.site.register(models.GeocodeCacheEntry)
+admin.site.register(models.RateLimitBucket)
@@ -102,10 +102,12 @@ def submit_jobs(environment, facility_list):
             item.save()
 
     # GEOCODE
+    # Geocoding is rate limited by the geocoder quota rather than by CPU, so
+    # a single job that keeps several requests in flight is submitted rather
+    # than an array job with a container per item.
     started = str(datetime.utcnow())
     geocode_job_id = submit_job('geocode',
-                                depends_on=[{'jobId': parse_job_id}],
-                                is_array=True)
+                                depends_on=[{'jobId': parse_job_id}])
     finished = str(datetime.utcnow())
     facility_list.refresh_from_db()
     with transaction.atomic():
@@ -113,7 +115,7 @@ def submit_jobs(environment, facility_list):
             item.processing_results.append({
                 'action': ProcessingAction.SUBMIT_JOB,
                 'type': 'geocode',
-                'job_id': '{0}:{1}'.format(geocode_job_id, item.row_index),
+                'job_id': geocode_job_id,
                 'error': False,
                 'started_at': started,
                 'finished_at': finished,
@@ -123,8 +125,7 @@ def submit_jobs(environment, facility_list):
     # MATCH
     started = str(datetime.utcnow())
     match_job_id = submit_job('match',
-                              depends_on=[{'jobId': geocode_job_id,
-                                           'type': 'N_TO_N'}],
+                              depends_on=[{'jobId': geocode_job_id}],
                               is_array=True)
     finished = str(datetime.utcnow())
     facility_list.refresh_from_db()
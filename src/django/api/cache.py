@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import time
+
+from datetime import datetime, timezone
+from functools import wraps
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlencode
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+FACILITIES_CACHE_ALIAS = 'facilities'
+FACILITIES_CACHE_VERSION_KEY = 'facilities:version'
+
+
+def get_facilities_cache():
+    return caches[FACILITIES_CACHE_ALIAS]
+
+
+def make_facilities_cache_version():
+    # The time of the change is included so that it can be used as the
+    # Last-Modified time of facility responses
+    return '{}-{}'.format(int(time.time()), uuid4().hex)
+
+
+def get_facilities_cache_version():
+    cache = get_facilities_cache()
+    version = cache.get(FACILITIES_CACHE_VERSION_KEY)
+    if version is None:
+        version = make_facilities_cache_version()
+        # Use add so that concurrent requests settle on the same version
+        if not cache.add(FACILITIES_CACHE_VERSION_KEY, version, None):
+            version = cache.get(FACILITIES_CACHE_VERSION_KEY, version)
+    return version
+
+
+def bump_facilities_cache_version():
+    """
+    Invalidate every cached facilities response by moving to a new version.
+    A random version is used rather than a counter so that a version key
+    evicted from the cache can never resurrect previously cached responses.
+    """
+    get_facilities_cache().set(FACILITIES_CACHE_VERSION_KEY,
+                               make_facilities_cache_version(), None)
+
+
+def get_facilities_cache_version_time(version):
+    timestamp, _ = version.split('-', 1)
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
+
+
+def make_facilities_cache_key(request):
+    """
+    Build a cache key from the request path and its query parameters. The
+    parameters are sorted by name and value so that requests with the same
+    filters in a different order share a cache entry.
+    """
+    params = sorted(
+        (key, sorted(request.query_params.getlist(key)))
+        for key in request.query_params.keys())
+    path = '{}?{}'.format(request.path, urlencode(params, doseq=True))
+    return 'facilities:{}:{}'.format(
+        get_facilities_cache_version(),
+        hashlib.md5(path.encode()).hexdigest())
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def make_cached_http_response(request, entry):
+    if accepts_gzip(request):
+        response = HttpResponse(entry['gzip_content'],
+                                content_type=entry['content_type'])
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(entry['content'],
+                                content_type=entry['content_type'])
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def cache_facilities_response(view_method):
+    """
+    Decorate a viewset method so that successful JSON responses are stored
+    in the facilities cache as rendered and gzipped bytes and are returned
+    from the cache for subsequent requests with the same parameters. Cached
+    responses are invalidated by `bump_facilities_cache_version`.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method != 'GET' \
+           or type(request.accepted_renderer) is not JSONRenderer:
+            return view_method(self, request, *args, **kwargs)
+
+        cache = get_facilities_cache()
+        key = make_facilities_cache_key(request)
+        entry = cache.get(key)
+
+        if entry is None:
+            response = view_method(self, request, *args, **kwargs)
+            if not isinstance(response, Response) \
+               or response.status_code != 200:
+                return response
+
+            content = request.accepted_renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context())
+            entry = {
+                'content': content,
+                'gzip_content': gzip.compress(content),
+                'content_type': request.accepted_renderer.media_type,
+            }
+            cache.set(key, entry)
+
+        return make_cached_http_response(request, entry)
+
+    return wrapper
@@ -0,0 +1,66 @@
+from django.db import connection
+
+from api.tiles import WEB_MERCATOR_HALF_WIDTH
+
+# The width of a grid cell in screen pixels. Facilities that fall in the same
+# cell are aggregated into a single cluster.
+CLUSTER_CELL_SIZE_IN_PIXELS = 64
+TILE_SIZE_IN_PIXELS = 256
+
+FACILITY_CLUSTER_SQL = """
+SELECT
+    COUNT(*),
+    ST_X(ST_Centroid(ST_Collect(api_facility.location))),
+    ST_Y(ST_Centroid(ST_Collect(api_facility.location))),
+    CASE WHEN COUNT(*) = 1 THEN MIN(api_facility.id) ELSE NULL END
+FROM api_facility
+WHERE api_facility.id IN ({facility_ids_sql})
+GROUP BY ST_SnapToGrid(ST_Transform(api_facility.location, 3857), %s)
+"""
+
+
+def get_cluster_cell_size(zoom):
+    """
+    Return the width, in Web Mercator meters, of the grid cell used to
+    cluster facilities at the specified zoom level.
+    """
+    tile_size = 2 * WEB_MERCATOR_HALF_WIDTH / (2 ** zoom)
+    return tile_size * CLUSTER_CELL_SIZE_IN_PIXELS / TILE_SIZE_IN_PIXELS
+
+
+def get_facility_clusters(queryset, zoom):
+    """
+    Aggregate the facilities in `queryset` into clusters by snapping their
+    locations to a grid sized for `zoom` and return them as a GeoJSON
+    FeatureCollection. Each feature is located at the centroid of its
+    facilities and has a `count` property. Clusters containing a single
+    facility also include the `oar_id` of that facility.
+    """
+    facility_ids_sql, facility_ids_params = \
+        queryset.values('id').query.sql_with_params()
+
+    sql = FACILITY_CLUSTER_SQL.format(facility_ids_sql=facility_ids_sql)
+    params = [*facility_ids_params, get_cluster_cell_size(zoom)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [lng, lat],
+                },
+                'properties': {
+                    'count': count,
+                    'oar_id': oar_id,
+                },
+            }
+            for (count, lng, lat, oar_id)
+            in rows
+        ],
+    }
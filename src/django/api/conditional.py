@@ -0,0 +1,62 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from api.cache import (get_facilities_cache_version,
+                       get_facilities_cache_version_time)
+from api.models import Organization
+
+
+def make_etag(*values):
+    return hashlib.md5(
+        ':'.join(str(value) for value in values).encode()).hexdigest()
+
+
+def condition_from_validators(get_validators):
+    """
+    Return a `django.views.decorators.http.condition` decorator that takes
+    both the ETag and the Last-Modified time from a single call to
+    `get_validators`, which receives the arguments of the view and must
+    return an `(etag, last_modified)` tuple, or `(None, None)` if the
+    resource does not exist.
+    """
+    def get_request_validators(request, *args, **kwargs):
+        if not hasattr(request, 'conditional_validators'):
+            request.conditional_validators = \
+                get_validators(request, *args, **kwargs)
+        return request.conditional_validators
+
+    def etag_func(request, *args, **kwargs):
+        return get_request_validators(request, *args, **kwargs)[0]
+
+    def last_modified_func(request, *args, **kwargs):
+        return get_request_validators(request, *args, **kwargs)[1]
+
+    return condition(etag_func=etag_func,
+                     last_modified_func=last_modified_func)
+
+
+def get_facilities_validators(request, *args, **kwargs):
+    """
+    Validators for facility responses, derived from the facilities cache
+    version so that they can be checked without querying the database. The
+    version is replaced whenever a change that affects any facility response
+    is committed, so the validators are shared by all facility responses and
+    change together.
+    """
+    version = get_facilities_cache_version()
+    return (make_etag(request.get_full_path(), version),
+            get_facilities_cache_version_time(version))
+
+
+def get_contributors_validators(request):
+    data = Organization \
+        .objects \
+        .aggregate(updated_at=Max('updated_at'), count=Count('id'))
+
+    if data['updated_at'] is None:
+        return (None, None)
+
+    return (make_etag(data['updated_at'].isoformat(), data['count']),
+            data['updated_at'])
@@ -13,6 +13,18 @@ class ProcessingAction:
 
 class FacilitiesQueryParams:
     NAME = 'name'
+    Q = 'q'
     CONTRIBUTORS = 'contributors'
     CONTRIBUTOR_TYPES = 'contributor_types'
     COUNTRIES = 'countries'
+    MIN_SIMILARITY = 'min_similarity'
+    BBOX = 'bbox'
+    ZOOM = 'zoom'
+    LAT = 'lat'
+    LNG = 'lng'
+    RADIUS = 'radius'
+    K = 'k'
+    PAGE_SIZE = 'page_size'
+    CURSOR = 'cursor'
+    FIELDS = 'fields'
+    OMIT = 'omit'
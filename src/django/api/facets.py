@@ -0,0 +1,75 @@
+from django.db.models import Count
+
+from api.countries import COUNTRY_NAMES
+from api.models import Facility, FacilityMatch
+
+ORGANIZATION_LOOKUP = 'facility_list_item__facility_list__organization'
+
+
+def get_country_facet(facility_ids):
+    rows = Facility \
+        .objects \
+        .filter(id__in=facility_ids) \
+        .values('country_code') \
+        .annotate(count=Count('id')) \
+        .order_by('-count', 'country_code')
+
+    return [
+        (row['country_code'],
+         COUNTRY_NAMES.get(row['country_code'], row['country_code']),
+         row['count'])
+        for row in rows
+    ]
+
+
+def get_contributor_facet(accepted_matches):
+    id_field = '{}__id'.format(ORGANIZATION_LOOKUP)
+    name_field = '{}__name'.format(ORGANIZATION_LOOKUP)
+
+    rows = accepted_matches \
+        .values(id_field, name_field) \
+        .annotate(count=Count('facility_id', distinct=True)) \
+        .order_by('-count', name_field)
+
+    return [
+        (row[id_field], row[name_field], row['count'])
+        for row in rows
+    ]
+
+
+def get_contributor_type_facet(accepted_matches):
+    type_field = '{}__org_type'.format(ORGANIZATION_LOOKUP)
+
+    rows = accepted_matches \
+        .values(type_field) \
+        .annotate(count=Count('facility_id', distinct=True)) \
+        .order_by('-count', type_field)
+
+    return [
+        (row[type_field], row[type_field], row['count'])
+        for row in rows
+    ]
+
+
+def get_facility_facets(queryset):
+    """
+    Count the facilities in `queryset` by country, contributor, and
+    contributor type. Each facet is computed with a single aggregate query
+    that receives the filtered facilities as a subquery. The values are
+    returned in the same (value, label) shape as the `/api/countries/`,
+    `/api/contributors/`, and `/api/contributor-types/` endpoints with the
+    count appended, ordered by descending count.
+    """
+    facility_ids = queryset.order_by().values('id')
+
+    accepted_matches = FacilityMatch \
+        .objects \
+        .filter(status__in=[FacilityMatch.AUTOMATIC,
+                            FacilityMatch.CONFIRMED],
+                facility_id__in=facility_ids)
+
+    return {
+        'countries': get_country_facet(facility_ids),
+        'contributors': get_contributor_facet(accepted_matches),
+        'contributor_types': get_contributor_type_facet(accepted_matches),
+    }
@@ -1,10 +1,57 @@
+import json
+import logging
+import random
+import time
+
+from datetime import timedelta
+from threading import Lock
+
 from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
 
 import requests
 
+from requests.adapters import HTTPAdapter
+
+from api.models import GeocodeCacheEntry, normalize_for_comparison
+from api.ratelimit import acquire_token
+
 
 ZERO_RESULTS = "ZERO_RESULTS"
 
+# HTTP and Geocoding API statuses that indicate a transient failure, for
+# which the request is retried after a backoff
+RETRYABLE_HTTP_STATUSES = (429, 500, 502, 503, 504)
+RETRYABLE_API_STATUSES = ("OVER_QUERY_LIMIT", "UNKNOWN_ERROR")
+
+GEOCODING_RATE_LIMIT_BUCKET = "geocoding"
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = Lock()
+
+# Inserts or refreshes a cache entry, counting the miss that caused the
+# address to be sent to the geocoder. An upsert is used because the same
+# address can be geocoded by concurrent Batch jobs.
+GEOCODE_CACHE_UPSERT_SQL = """
+INSERT INTO api_geocodecacheentry (
+    normalized_address, country_code, geocoded_address, geocoded_point,
+    response, hit_count, miss_count, expires_at, created_at, updated_at)
+VALUES (
+    %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326),
+    %s, 0, 1, %s, now(), now())
+ON CONFLICT (normalized_address, country_code) DO UPDATE SET
+    geocoded_address = EXCLUDED.geocoded_address,
+    geocoded_point = EXCLUDED.geocoded_point,
+    response = EXCLUDED.response,
+    miss_count = api_geocodecacheentry.miss_count + 1,
+    expires_at = EXCLUDED.expires_at,
+    updated_at = now()
+"""
+
 
 def create_geocoding_api_url(address, country_code):
     return (
@@ -28,17 +75,166 @@ def format_geocoded_address_data(data):
     }
 
 
-def geocode_address(address, country_code):
-    request_url = create_geocoding_api_url(address, country_code)
-    r = requests.get(request_url)
+def get_geocoding_session():
+    """
+    Return the `requests.Session` shared by all geocoding requests in the
+    process so that connections to the Geocoding API are kept alive and
+    reused. The connection pool is sized to allow concurrent requests from
+    multiple threads.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.GEOCODING_CONNECTION_POOL_SIZE)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+def get_retry_delay(attempt):
+    """
+    Return the number of seconds to wait before retry number `attempt`,
+    counting from 0, using exponential backoff with full jitter.
+    """
+    max_delay = min(settings.GEOCODING_MAX_BACKOFF_SECONDS,
+                    settings.GEOCODING_BACKOFF_SECONDS * 2 ** attempt)
+    return random.uniform(0, max_delay)
+
+
+def request_geocoding_api(request_url):
+    """
+    Return the decoded JSON response of a Geocoding API request. Connection
+    errors, timeouts, and responses with a retryable HTTP or API status are
+    retried up to `GEOCODING_MAX_RETRIES` times before the last error is
+    raised as a `ValueError`. Every attempt waits for a token from the rate
+    limit bucket shared by all geocoding workers, if one is configured.
+    """
+    session = get_geocoding_session()
+    timeout = (settings.GEOCODING_CONNECT_TIMEOUT_SECONDS,
+               settings.GEOCODING_READ_TIMEOUT_SECONDS)
+
+    for attempt in range(settings.GEOCODING_MAX_RETRIES + 1):
+        if attempt > 0:
+            time.sleep(get_retry_delay(attempt - 1))
+
+        if settings.GEOCODING_REQUESTS_PER_SECOND:
+            acquire_token(GEOCODING_RATE_LIMIT_BUCKET,
+                          settings.GEOCODING_REQUESTS_PER_SECOND)
+
+        try:
+            r = session.get(request_url, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = "Geocoding request failed: {}".format(e)
+            continue
+
+        if r.status_code in RETRYABLE_HTTP_STATUSES:
+            error = "Geocoding request failed with status {}" \
+                .format(r.status_code)
+            continue
+
+        if r.status_code != 200:
+            raise ValueError("Geocoding request failed with status {}"
+                             .format(r.status_code))
+
+        data = r.json()
+
+        if data["status"] in RETRYABLE_API_STATUSES:
+            error = "Geocoding request failed with status {}" \
+                .format(data["status"])
+            continue
+
+        return data
 
-    if r.status_code != 200:
-        raise ValueError("Geocoding request failed with status"
-                         .format(r.status_code))
+    raise ValueError(error)
 
-    data = r.json()
+
+def geocode_address(address, country_code):
+    request_url = create_geocoding_api_url(address, country_code)
+    data = request_geocoding_api(request_url)
 
     if data["status"] == ZERO_RESULTS or len(data["results"]) == 0:
         raise ValueError("No results were found")
 
     return format_geocoded_address_data(data)
+
+
+def make_compact_response(data):
+    first_result, *_ = data["results"]
+    return {
+        "status": data["status"],
+        "results": [first_result],
+    }
+
+
+def get_cached_geocoded_address_data(normalized_address, country_code):
+    now = timezone.now()
+    entry = GeocodeCacheEntry \
+        .objects \
+        .filter(normalized_address=normalized_address,
+                country_code=country_code,
+                expires_at__gt=now) \
+        .first()
+
+    if entry is None:
+        return None
+
+    GeocodeCacheEntry \
+        .objects \
+        .filter(pk=entry.pk) \
+        .update(hit_count=F('hit_count') + 1, last_hit_at=now)
+
+    return {
+        "geocoded_point": {
+            "lat": entry.geocoded_point.y,
+            "lng": entry.geocoded_point.x,
+        },
+        "geocoded_address": entry.geocoded_address,
+        "full_response": entry.response,
+    }
+
+
+def cache_geocoded_address_data(normalized_address, country_code, data):
+    expires_at = timezone.now() + timedelta(
+        days=settings.GEOCODE_CACHE_TTL_DAYS)
+
+    with connection.cursor() as cursor:
+        cursor.execute(GEOCODE_CACHE_UPSERT_SQL, [
+            normalized_address,
+            country_code,
+            data["geocoded_address"],
+            data["geocoded_point"]["lng"],
+            data["geocoded_point"]["lat"],
+            json.dumps(data["full_response"]),
+            expires_at,
+        ])
+
+
+def cached_geocode_address(address, country_code):
+    """
+    Return the same data as `geocode_address`, using an unexpired result
+    from the geocode cache for the same normalized address and country if
+    one exists. Successful results from the geocoder are added to the cache
+    with their response reduced to the status and the first result.
+    """
+    normalized_address = normalize_for_comparison(address)
+    data = get_cached_geocoded_address_data(normalized_address, country_code)
+    if data is not None:
+        return data
+
+    data = geocode_address(address, country_code)
+    data["full_response"] = make_compact_response(data["full_response"])
+
+    # A result that can not be cached is still returned. The savepoint keeps
+    # the failure from breaking the transaction of the caller.
+    try:
+        with transaction.atomic():
+            cache_geocoded_address_data(normalized_address, country_code,
+                                        data)
+    except DatabaseError:
+        logger.exception("Failed to cache the geocoding result for %s, %s",
+                         address, country_code)
+
+    return data
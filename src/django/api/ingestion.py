@@ -0,0 +1,164 @@
+from datetime import timedelta
+from threading import Thread
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.aws_batch import submit_jobs
+from api.models import FacilityList
+from api.processing import (create_facility_list_items,
+                            items_require_processing)
+from api.threads import closing_connection
+from api.uploads import iter_uploaded_lines
+
+
+def submit_processing_jobs(facility_list):
+    if settings.ENVIRONMENT in ('Staging', 'Production') \
+       and items_require_processing(facility_list):
+        submit_jobs(settings.ENVIRONMENT, facility_list)
+
+
+def delete_stored_upload(facility_list):
+    """
+    Remove the stored upload of a `FacilityList` whose ingestion failed.
+    Only the file column is updated so that the status recorded for the
+    failure is not overwritten.
+    """
+    if facility_list.file:
+        facility_list.file.delete(save=False)
+        FacilityList \
+            .objects \
+            .filter(pk=facility_list.pk) \
+            .update(file=None)
+
+
+def deactivate_replaced_list(facility_list):
+    replaces = facility_list.replaces
+    if replaces is not None:
+        replaces.is_active = False
+        replaces.save()
+
+
+def ingest_facility_list(facility_list_id):
+    """
+    Create the items of a `FacilityList` from its stored upload and submit
+    the jobs that process them. The progress is recorded in
+    `ingestion_status` so that it can be polled by the uploader, and the
+    stored file is removed once its items have been created. The list that
+    it replaces, if any, is only deactivated if ingestion succeeds.
+    """
+    # Claim the list with a single update so that a list that is enqueued
+    # again by `recover_stalled_ingestions` is only ingested once
+    claimed = FacilityList \
+        .objects \
+        .filter(pk=facility_list_id,
+                ingestion_status=FacilityList.PENDING) \
+        .update(ingestion_status=FacilityList.INGESTING,
+                updated_at=timezone.now())
+    if not claimed:
+        return
+
+    facility_list = FacilityList.objects.get(pk=facility_list_id)
+
+    try:
+        with transaction.atomic():
+            with facility_list.file.open('rb') as uploaded_file:
+                create_facility_list_items(
+                    facility_list, iter_uploaded_lines(uploaded_file))
+            deactivate_replaced_list(facility_list)
+            facility_list.ingestion_status = FacilityList.COMPLETE
+            facility_list.save()
+
+        facility_list.file.delete()
+        submit_processing_jobs(facility_list)
+    except Exception as e:
+        FacilityList \
+            .objects \
+            .filter(pk=facility_list_id) \
+            .update(ingestion_status=FacilityList.ERROR,
+                    ingestion_error=str(e),
+                    updated_at=timezone.now())
+        # A failed list is not ingested again, so its upload is not needed
+        delete_stored_upload(facility_list)
+
+
+def recover_stalled_ingestions(timeout=None):
+    """
+    Resolve facility lists whose ingestion has not finished within `timeout`
+    minutes, which happens when the process running the ingestion worker
+    exits, so that the uploader polling the status gets an answer. Lists
+    that were never picked up are ingested in the calling process. Lists
+    whose ingestion was interrupted are marked as failed rather than being
+    retried, because the upload may be what caused the worker to exit.
+    Returns the number of lists ingested and failed.
+    """
+    if timeout is None:
+        timeout = settings.FACILITY_LIST_INGESTION_TIMEOUT_MINUTES
+    stalled_before = timezone.now() - timedelta(minutes=timeout)
+
+    interrupted = FacilityList \
+        .objects \
+        .filter(ingestion_status=FacilityList.INGESTING,
+                updated_at__lt=stalled_before)
+
+    failed = 0
+    for facility_list in interrupted:
+        failed += FacilityList \
+            .objects \
+            .filter(pk=facility_list.pk,
+                    ingestion_status=FacilityList.INGESTING) \
+            .update(ingestion_status=FacilityList.ERROR,
+                    ingestion_error='Ingestion was interrupted. Please '
+                                    'upload the list again.',
+                    updated_at=timezone.now())
+        delete_stored_upload(facility_list)
+
+    pending_ids = FacilityList \
+        .objects \
+        .filter(ingestion_status=FacilityList.PENDING,
+                updated_at__lt=stalled_before) \
+        .values_list('id', flat=True)
+
+    ingested = 0
+    for facility_list_id in list(pending_ids):
+        ingest_facility_list(facility_list_id)
+        ingested += 1
+
+    return ingested, failed
+
+
+class SynchronousIngestionWorker:
+    """
+    Ingest facility lists in the calling thread. Used by the tests so that
+    the result of an upload can be inspected as soon as it is enqueued.
+    """
+    def enqueue(self, facility_list_id):
+        ingest_facility_list(facility_list_id)
+
+
+class ThreadIngestionWorker:
+    """
+    Ingest facility lists in a background thread of the web process so that
+    the upload request can return before the items are created.
+    """
+    def enqueue(self, facility_list_id):
+        Thread(target=self.run, args=(facility_list_id,), daemon=True).start()
+
+    def run(self, facility_list_id):
+        with closing_connection():
+            ingest_facility_list(facility_list_id)
+
+
+def get_ingestion_worker():
+    return import_string(settings.FACILITY_LIST_INGESTION_WORKER)()
+
+
+def enqueue_facility_list_ingestion(facility_list):
+    """
+    Hand a `FacilityList` with a stored upload to the configured ingestion
+    worker once the current transaction, which creates the list, commits.
+    """
+    transaction.on_commit(
+        lambda: get_ingestion_worker().enqueue(facility_list.id))
@@ -7,7 +7,9 @@ from django.db import transaction
 from api.constants import ProcessingAction
 from api.models import FacilityList, FacilityListItem
 from api.processing import (parse_facility_list_item,
+                            parse_facility_list_items,
                             geocode_facility_list_item,
+                            geocode_facility_list_items,
                             match_facility_list_item)
 
 ACTIONS = {
@@ -16,6 +18,15 @@ ACTIONS = {
     ProcessingAction.MATCH: match_facility_list_item,
 }
 
+# The status an item must have for an action to be performed on it. Items
+# that are already past this status, such as those that reused the results of
+# a replaced list, are skipped.
+REQUIRED_STATUSES = {
+    ProcessingAction.PARSE: FacilityListItem.UPLOADED,
+    ProcessingAction.GEOCODE: FacilityListItem.PARSED,
+    ProcessingAction.MATCH: FacilityListItem.GEOCODED,
+}
+
 
 class Command(BaseCommand):
     help = 'Run an action on all items in a facility list. If ' \
@@ -34,6 +45,11 @@ class Command(BaseCommand):
         group.add_argument('-l', '--list-id',
                            required=True,
                            help='The id of the facility list to process.')
+        parser.add_argument('-c', '--concurrency',
+                            type=int,
+                            help='The number of geocoding requests to keep '
+                                 'in flight. Defaults to the '
+                                 'GEOCODING_CONCURRENCY setting.')
 
     def handle(self, *args, **options):
         action = options['action']
@@ -46,8 +62,6 @@ class Command(BaseCommand):
                               .format(action))
             sys.exit(1)
 
-        process = ACTIONS[action]
-
         # Crash if invalid list_id specified
         try:
             facility_list = FacilityList.objects.get(pk=list_id)
@@ -65,6 +79,40 @@ class Command(BaseCommand):
             items = FacilityListItem.objects.filter(
                 facility_list=facility_list)
 
+        items = items \
+            .filter(status=REQUIRED_STATUSES[action]) \
+            .select_related('facility_list')
+
+        if action == ProcessingAction.PARSE and not row_index:
+            # Parsing does not call external services, so the whole list is
+            # parsed in batches rather than one transaction per item
+            result = parse_facility_list_items(facility_list)
+        elif action == ProcessingAction.GEOCODE:
+            # Items are geocoded outside of a transaction, including single
+            # items of an array job, so that the shared rate limit bucket is
+            # not held locked while a request is in flight
+            result = geocode_facility_list_items(items,
+                                                 options['concurrency'])
+        else:
+            result = self.process_items(action, items)
+
+        # Print successes
+        if result['success'] > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    '{}: {} successes'.format(
+                        action, result['success'])))
+
+        # Print failures
+        if result['failure'] > 0:
+            self.stdout.write(
+                self.style.ERROR(
+                    '{}: {} failures'.format(
+                        action, result['failure'])))
+
+    def process_items(self, action, items):
+        process = ACTIONS[action]
+
         result = {
             'success': 0,
             'failure': 0,
@@ -100,16 +148,4 @@ class Command(BaseCommand):
                 self.stderr.write('Value Error: {}'.format(e))
                 result['failure'] += 1
 
-        # Print successes
-        if result['success'] > 0:
-            self.stdout.write(
-                self.style.SUCCESS(
-                    '{}: {} successes'.format(
-                        action, result['success'])))
-
-        # Print failures
-        if result['failure'] > 0:
-            self.stdout.write(
-                self.style.ERROR(
-                    '{}: {} failures'.format(
-                        action, result['failure'])))
+        return result
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from api.models import GeocodeCacheEntry
+
+
+class Command(BaseCommand):
+    help = 'Delete expired entries from the geocode cache and report the ' \
+           'number of cache hits and misses of the remaining entries.'
+
+    def handle(self, *args, **options):
+        deleted, _ = GeocodeCacheEntry \
+            .objects \
+            .filter(expires_at__lte=timezone.now()) \
+            .delete()
+
+        totals = GeocodeCacheEntry \
+            .objects \
+            .aggregate(entries=Count('id'),
+                       hits=Sum('hit_count'),
+                       misses=Sum('miss_count'))
+
+        self.stdout.write(
+            'Deleted {} expired entries. {} entries remain with {} hits '
+            'and {} misses.'.format(deleted,
+                                    totals['entries'],
+                                    totals['hits'] or 0,
+                                    totals['misses'] or 0))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Facility
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the contributor, alias, and search columns of every ' \
+           'facility from its accepted matches. Facilities are updated in ' \
+           'batches, each in its own transaction, so that rows are not ' \
+           'locked for the duration of the rebuild.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size',
+                            type=int,
+                            default=1000,
+                            help='The number of facilities to update in each '
+                                 'transaction.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        facility_ids = list(
+            Facility
+            .objects
+            .order_by('id')
+            .values_list('id', flat=True))
+
+        for start in range(0, len(facility_ids), batch_size):
+            with transaction.atomic():
+                Facility \
+                    .objects \
+                    .filter(id__in=facility_ids[start:start + batch_size]) \
+                    .update_summaries()
+
+        self.stdout.write(
+            'Rebuilt the summaries of {} facilities.'.format(
+                len(facility_ids)))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.ingestion import recover_stalled_ingestions
+
+
+class Command(BaseCommand):
+    help = 'Ingest asynchronously uploaded facility lists that were never ' \
+           'picked up by a worker and mark those whose ingestion was ' \
+           'interrupted as failed. Intended to be run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-t', '--timeout',
+                            type=int,
+                            help='The number of minutes after which an '
+                                 'ingestion is considered stalled. Defaults '
+                                 'to the FACILITY_LIST_INGESTION_TIMEOUT_'
+                                 'MINUTES setting.')
+
+    def handle(self, *args, **options):
+        ingested, failed = recover_stalled_ingestions(options['timeout'])
+        self.stdout.write(
+            'Ingested {} stalled facility lists and marked {} interrupted '
+            'ingestions as failed.'.format(ingested, failed))
@@ -0,0 +1,21 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_facility_created_at_id_index'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            'CREATE INDEX api_facility_name_trgm_idx '
+            'ON api_facility USING gin (name gin_trgm_ops);',
+            'DROP INDEX api_facility_name_trgm_idx;'),
+        migrations.RunSQL(
+            'CREATE INDEX api_fli_name_trgm_idx '
+            'ON api_facilitylistitem USING gin (name gin_trgm_ops);',
+            'DROP INDEX api_fli_name_trgm_idx;'),
+    ]
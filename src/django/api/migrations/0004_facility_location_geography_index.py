@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_trigram_name_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX api_facility_location_geog_idx '
+            'ON api_facility USING gist ((location::geography));',
+            'DROP INDEX api_facility_location_geog_idx;'),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_facility_location_geography_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facilitymatch',
+            index=models.Index(fields=['status', 'facility'], name='api_fm_status_facility_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_tables(apps, schema_editor):
+    # Creates the tables for any database-backed caches configured in
+    # settings. Existing tables are left untouched.
+    call_command('createcachetable',
+                 database=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_facilitymatch_status_facility_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_create_facilities_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facility',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Full text search index of the names and addresses of the facility and of the list items matched to it.', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_facility_search_idx'),
+        ),
+        migrations.RunSQL("""
+            UPDATE api_facility SET search_vector =
+                setweight(to_tsvector('simple', api_facility.name), 'A') ||
+                setweight(to_tsvector('simple', coalesce(aliases.names, '')), 'B') ||
+                setweight(to_tsvector('simple', api_facility.address), 'C') ||
+                setweight(to_tsvector('simple', coalesce(aliases.addresses, '')), 'D')
+            FROM (
+                SELECT
+                    api_facility.id AS facility_id,
+                    string_agg(api_facilitylistitem.name, ' ') AS names,
+                    string_agg(api_facilitylistitem.address, ' ') AS addresses
+                FROM api_facility
+                LEFT JOIN api_facilitymatch
+                    ON api_facilitymatch.facility_id = api_facility.id
+                    AND api_facilitymatch.status IN ('AUTOMATIC', 'CONFIRMED')
+                LEFT JOIN api_facilitylistitem
+                    ON api_facilitylistitem.id = api_facilitymatch.facility_list_item_id
+                    AND EXISTS (
+                        SELECT 1 FROM api_facilitylist
+                        WHERE api_facilitylist.id = api_facilitylistitem.facility_list_id
+                        AND api_facilitylist.is_active
+                        AND api_facilitylist.is_public
+                    )
+                GROUP BY api_facility.id
+            ) AS aliases
+            WHERE api_facility.id = aliases.facility_id
+        """, migrations.RunSQL.noop),
+    ]
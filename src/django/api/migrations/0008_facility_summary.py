@@ -0,0 +1,108 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_facility_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facility',
+            name='alias_addresses',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, editable=False, help_text='The addresses, other than the canonical address, of the items in active, public lists matched to the facility.', size=None),
+        ),
+        migrations.AddField(
+            model_name='facility',
+            name='alias_names',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, editable=False, help_text='The names, other than the canonical name, of the items in active, public lists matched to the facility.', size=None),
+        ),
+        migrations.AddField(
+            model_name='facility',
+            name='contributor_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, editable=False, help_text='The IDs of the organizations that have contributed a list item matched to the facility.', size=None),
+        ),
+        migrations.AddField(
+            model_name='facility',
+            name='contributor_names',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, editable=False, help_text='The organization and list names of the active, public lists that have contributed an item matched to the facility.', size=None),
+        ),
+        migrations.AddField(
+            model_name='facility',
+            name='contributor_types',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, editable=False, help_text='The types of the organizations that have contributed a list item matched to the facility.', size=None),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['contributor_ids'], name='api_facility_contrib_ids_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['contributor_types'], name='api_facility_contrib_types_idx'),
+        ),
+        migrations.RunSQL("""
+            UPDATE api_facility SET
+                contributor_ids = summary.contributor_ids,
+                contributor_types = summary.contributor_types,
+                contributor_names = summary.contributor_names,
+                alias_names = summary.alias_names,
+                alias_addresses = summary.alias_addresses,
+                search_vector =
+                    setweight(to_tsvector('simple', api_facility.name), 'A') ||
+                    setweight(to_tsvector('simple',
+                                          array_to_string(summary.alias_names, ' ')),
+                              'B') ||
+                    setweight(to_tsvector('simple', api_facility.address), 'C') ||
+                    setweight(to_tsvector('simple',
+                                          array_to_string(summary.alias_addresses, ' ')),
+                              'D')
+            FROM (
+                SELECT
+                    api_facility.id AS facility_id,
+                    array_remove(
+                        array_agg(DISTINCT api_organization.id), NULL
+                    ) AS contributor_ids,
+                    array_remove(
+                        array_agg(DISTINCT api_organization.org_type::text), NULL
+                    ) AS contributor_types,
+                    array_remove(
+                        array_agg(DISTINCT CASE WHEN api_facilitylist.is_active
+                            AND api_facilitylist.is_public
+                            THEN api_organization.name || ' (' ||
+                                 api_facilitylist.name || ')'
+                        END), NULL
+                    ) AS contributor_names,
+                    array_remove(
+                        array_agg(DISTINCT CASE WHEN api_facilitylist.is_active
+                            AND api_facilitylist.is_public
+                            AND api_facilitylistitem.name <> ''
+                            AND api_facilitylistitem.name <> api_facility.name
+                            THEN api_facilitylistitem.name::text
+                        END), NULL
+                    ) AS alias_names,
+                    array_remove(
+                        array_agg(DISTINCT CASE WHEN api_facilitylist.is_active
+                            AND api_facilitylist.is_public
+                            AND api_facilitylistitem.address <> ''
+                            AND api_facilitylistitem.address <> api_facility.address
+                            THEN api_facilitylistitem.address::text
+                        END), NULL
+                    ) AS alias_addresses
+                FROM api_facility
+                LEFT JOIN api_facilitymatch
+                    ON api_facilitymatch.facility_id = api_facility.id
+                    AND api_facilitymatch.status IN ('AUTOMATIC', 'CONFIRMED')
+                LEFT JOIN api_facilitylistitem
+                    ON api_facilitylistitem.id = api_facilitymatch.facility_list_item_id
+                LEFT JOIN api_facilitylist
+                    ON api_facilitylist.id = api_facilitylistitem.facility_list_id
+                LEFT JOIN api_organization
+                    ON api_organization.id = api_facilitylist.organization_id
+                GROUP BY api_facility.id
+            ) AS summary
+            WHERE api_facility.id = summary.facility_id
+        """, migrations.RunSQL.noop),
+    ]
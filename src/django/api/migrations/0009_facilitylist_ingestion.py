@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_facility_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facilitylist',
+            name='file',
+            field=models.FileField(blank=True, editable=False, help_text='The uploaded file, stored until its items are created by an asynchronous ingestion worker.', null=True, upload_to='facility_lists/'),
+        ),
+        migrations.AddField(
+            model_name='facilitylist',
+            name='ingestion_error',
+            field=models.TextField(blank=True, editable=False, help_text='The error that caused ingestion to fail, if any.', null=True),
+        ),
+        migrations.AddField(
+            model_name='facilitylist',
+            name='ingestion_status',
+            field=models.CharField(choices=[('PENDING', 'PENDING'), ('INGESTING', 'INGESTING'), ('COMPLETE', 'COMPLETE'), ('ERROR', 'ERROR')], default='COMPLETE', help_text='The progress of creating the items of the list from the uploaded file.', max_length=200),
+        ),
+    ]
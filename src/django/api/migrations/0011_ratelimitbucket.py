@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='The name of the rate limited service.', max_length=100, unique=True)),
+                ('tokens', models.FloatField(help_text='The number of tokens available when the bucket was last updated. Negative when tokens have been reserved by callers that are waiting for them to be refilled.')),
+                ('updated_at', models.DateTimeField(help_text='When tokens were last taken from the bucket.')),
+            ],
+        ),
+    ]
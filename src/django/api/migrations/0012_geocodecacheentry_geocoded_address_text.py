@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='geocodecacheentry',
+            name='geocoded_address',
+            field=models.TextField(help_text='The formatted address returned by the geocoder.'),
+        ),
+    ]
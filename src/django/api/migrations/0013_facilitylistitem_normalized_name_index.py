@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_geocodecacheentry_geocoded_address_text'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX api_fli_list_normalized_name_idx '
+            'ON api_facilitylistitem (facility_list_id, '
+            "lower(btrim(regexp_replace(name, '\\s+', ' ', 'g'))));",
+            'DROP INDEX api_fli_list_normalized_name_idx;'),
+    ]
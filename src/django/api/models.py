@@ -4,9 +4,20 @@ from django.contrib.auth.models import (AbstractBaseUser,
                                         BaseUserManager,
                                         PermissionsMixin)
 from django.contrib.gis.db import models as gis_models
+from django.contrib.gis.geos import Polygon
 from django.contrib.postgres import fields as postgres
-from django.db import models
-
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery,
+                                            SearchRank,
+                                            SearchVectorField,
+                                            TrigramSimilarity)
+from django.db import connection, models
+from django.db.models import F, Func, OuterRef, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest, Lower
+from rest_framework.exceptions import ValidationError
+
+from api.constants import FacilitiesQueryParams
 from api.countries import COUNTRY_CHOICES
 
 
@@ -158,6 +169,18 @@ class FacilityList(models.Model):
     """
     Metadata for an uploaded list of facilities.
     """
+    PENDING = 'PENDING'
+    INGESTING = 'INGESTING'
+    COMPLETE = 'COMPLETE'
+    ERROR = 'ERROR'
+
+    INGESTION_STATUS_CHOICES = (
+        (PENDING, PENDING),
+        (INGESTING, INGESTING),
+        (COMPLETE, COMPLETE),
+        (ERROR, ERROR),
+    )
+
     organization = models.ForeignKey(
         'Organization',
         on_delete=models.PROTECT,
@@ -182,6 +205,26 @@ class FacilityList(models.Model):
         blank=False,
         editable=False,
         help_text='The header row of the uploaded CSV.')
+    file = models.FileField(
+        upload_to='facility_lists/',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=('The uploaded file, stored until its items are created by '
+                   'an asynchronous ingestion worker.'))
+    ingestion_status = models.CharField(
+        max_length=200,
+        null=False,
+        blank=False,
+        choices=INGESTION_STATUS_CHOICES,
+        default=COMPLETE,
+        help_text=('The progress of creating the items of the list from the '
+                   'uploaded file.'))
+    ingestion_error = models.TextField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text='The error that caused ingestion to fail, if any.')
     is_active = models.BooleanField(
         null=False,
         default=True,
@@ -311,12 +354,370 @@ class FacilityListItem(models.Model):
         return 'FacilityListItem {id} - {status}'.format(**self.__dict__)
 
 
+# Rebuilds the summary columns of each facility from the list items that have
+# been matched to it. The contributor IDs and types include every accepted
+# match so that they can back the contributor filters, while the contributor
+# names, aliases, and `search_vector` only include items from active and public
+# lists. The 'simple' text search configuration is used because facility names
+# and addresses are not all in English.
+FACILITY_SUMMARY_SQL = """
+UPDATE api_facility SET
+    contributor_ids = summary.contributor_ids,
+    contributor_types = summary.contributor_types,
+    contributor_names = summary.contributor_names,
+    alias_names = summary.alias_names,
+    alias_addresses = summary.alias_addresses,
+    search_vector =
+        setweight(to_tsvector('simple', api_facility.name), 'A') ||
+        setweight(to_tsvector('simple',
+                              array_to_string(summary.alias_names, ' ')),
+                  'B') ||
+        setweight(to_tsvector('simple', api_facility.address), 'C') ||
+        setweight(to_tsvector('simple',
+                              array_to_string(summary.alias_addresses, ' ')),
+                  'D')
+FROM (
+    SELECT
+        api_facility.id AS facility_id,
+        array_remove(
+            array_agg(DISTINCT api_organization.id), NULL
+        ) AS contributor_ids,
+        array_remove(
+            array_agg(DISTINCT api_organization.org_type::text), NULL
+        ) AS contributor_types,
+        array_remove(
+            array_agg(DISTINCT CASE WHEN api_facilitylist.is_active
+                AND api_facilitylist.is_public
+                THEN api_organization.name || ' (' ||
+                     api_facilitylist.name || ')'
+            END), NULL
+        ) AS contributor_names,
+        array_remove(
+            array_agg(DISTINCT CASE WHEN api_facilitylist.is_active
+                AND api_facilitylist.is_public
+                AND api_facilitylistitem.name <> ''
+                AND api_facilitylistitem.name <> api_facility.name
+                THEN api_facilitylistitem.name::text
+            END), NULL
+        ) AS alias_names,
+        array_remove(
+            array_agg(DISTINCT CASE WHEN api_facilitylist.is_active
+                AND api_facilitylist.is_public
+                AND api_facilitylistitem.address <> ''
+                AND api_facilitylistitem.address <> api_facility.address
+                THEN api_facilitylistitem.address::text
+            END), NULL
+        ) AS alias_addresses
+    FROM api_facility
+    LEFT JOIN api_facilitymatch
+        ON api_facilitymatch.facility_id = api_facility.id
+        AND api_facilitymatch.status IN ('AUTOMATIC', 'CONFIRMED')
+    LEFT JOIN api_facilitylistitem
+        ON api_facilitylistitem.id = api_facilitymatch.facility_list_item_id
+    LEFT JOIN api_facilitylist
+        ON api_facilitylist.id = api_facilitylistitem.facility_list_id
+    LEFT JOIN api_organization
+        ON api_organization.id = api_facilitylist.organization_id
+    WHERE api_facility.id IN ({facility_ids_sql})
+    GROUP BY api_facility.id
+) AS summary
+WHERE api_facility.id = summary.facility_id
+"""
+
+
+def make_point(lng, lat):
+    return Func(
+        Func(Value(lng), Value(lat), function='ST_MakePoint',
+             output_field=gis_models.PointField()),
+        Value(4326),
+        function='ST_SetSRID',
+        output_field=gis_models.PointField())
+
+
+def as_geography(expression):
+    return Func(expression,
+                template='(%(expressions)s)::geography',
+                output_field=gis_models.PointField(geography=True))
+
+
+def normalize_for_comparison(value):
+    """
+    Collapse runs of whitespace in `value` to single spaces, strip it, and
+    lowercase it, so that names and addresses that differ only in case or
+    whitespace compare equal.
+    """
+    return ' '.join(value.split()).lower()
+
+
+def normalize_text(expression):
+    """
+    The SQL equivalent of `normalize_for_comparison`. Filtering the items of
+    a list by the normalized name uses the api_fli_list_normalized_name_idx
+    expression index, so the expression must not be changed without changing
+    that index.
+    """
+    return Lower(Func(
+        Func(expression, Value(r'\s+'), Value(' '), Value('g'),
+             function='regexp_replace'),
+        function='btrim'))
+
+
+# The IDs of facilities whose name, or the name of an item from an active,
+# public list matched to them, contains or is similar to the search. Each
+# branch of the UNION uses ILIKE and the pg_trgm similarity operator on a
+# name column so that both can be answered from the trigram GIN index on
+# that column, which Django's `icontains` (UPPER(...) LIKE UPPER(...)) and a
+# single OR across the two tables would prevent.
+FACILITY_NAME_SEARCH_SQL = """
+SELECT api_facility.id
+FROM api_facility
+WHERE api_facility.name ILIKE %s
+   OR api_facility.name %% %s
+UNION
+SELECT api_facilitymatch.facility_id
+FROM api_facilitylistitem
+JOIN api_facilitymatch
+  ON api_facilitymatch.facility_list_item_id = api_facilitylistitem.id
+JOIN api_facilitylist
+  ON api_facilitylist.id = api_facilitylistitem.facility_list_id
+WHERE (api_facilitylistitem.name ILIKE %s
+       OR api_facilitylistitem.name %% %s)
+  AND api_facilitymatch.status IN (%s, %s)
+  AND api_facilitylist.is_active
+  AND api_facilitylist.is_public
+"""
+
+
+def make_contains_pattern(value):
+    """
+    Return a LIKE pattern that matches strings containing `value`, with the
+    LIKE wildcards in `value` escaped.
+    """
+    escaped = value \
+        .replace('\\', '\\\\') \
+        .replace('%', '\\%') \
+        .replace('_', '\\_')
+    return '%{}%'.format(escaped)
+
+
+class FacilityQuerySet(models.QuerySet):
+    def filter_by_query_params(self, params):
+        """
+        Return a queryset of facilities filtered by the `FacilitiesQueryParams`
+        values present in `params`, which is typically the `query_params`
+        attribute of a request.
+        """
+        name = params.get(FacilitiesQueryParams.NAME, None)
+        q = params.get(FacilitiesQueryParams.Q, None)
+        contributors = params.getlist(FacilitiesQueryParams.CONTRIBUTORS)
+        contributor_types = params \
+            .getlist(FacilitiesQueryParams.CONTRIBUTOR_TYPES)
+        countries = params.getlist(FacilitiesQueryParams.COUNTRIES)
+        bbox = params.get(FacilitiesQueryParams.BBOX, None)
+        lat = params.get(FacilitiesQueryParams.LAT, None)
+        lng = params.get(FacilitiesQueryParams.LNG, None)
+        radius = params.get(FacilitiesQueryParams.RADIUS, None)
+
+        queryset = self
+
+        if bbox is not None:
+            queryset = queryset.filter_by_bbox(bbox)
+
+        if lat is not None or lng is not None or radius is not None:
+            queryset = queryset.filter_by_radius(lat, lng, radius)
+
+        if name is not None:
+            queryset = queryset.search_by_name(
+                name, params.get(FacilitiesQueryParams.MIN_SIMILARITY, None))
+
+        if q is not None:
+            queryset = queryset.search(q)
+
+        if countries is not None and len(countries):
+            queryset = queryset.filter(country_code__in=countries)
+
+        if len(contributor_types):
+            queryset = queryset.filter(
+                contributor_types__overlap=contributor_types)
+
+        if len(contributors):
+            queryset = queryset.filter(contributor_ids__overlap=contributors)
+
+        return queryset
+
+    def filter_by_bbox(self, bbox):
+        """
+        Return facilities located within `bbox`, a string of comma-separated
+        WGS84 coordinates in west, south, east, north order.
+        """
+        try:
+            bbox_polygon = Polygon.from_bbox(
+                [float(coord) for coord in bbox.split(',')])
+            bbox_polygon.srid = 4326
+        except (TypeError, ValueError):
+            raise ValidationError(
+                '"{}" must be four comma-separated numbers: '
+                'west, south, east, north.'.format(FacilitiesQueryParams.BBOX))
+
+        return self.filter(location__within=bbox_polygon)
+
+    def filter_by_radius(self, lat, lng, radius):
+        """
+        Return facilities located within `radius` meters of the `lat`, `lng`
+        point. The distance is calculated on the spheroid by casting the
+        locations to geography, which is backed by a GiST index on the same
+        expression.
+        """
+        try:
+            lat, lng, radius = float(lat), float(lng), float(radius)
+        except (TypeError, ValueError):
+            raise ValidationError(
+                '"{}", "{}", and "{}" must all be specified as numbers.'
+                .format(FacilitiesQueryParams.LAT,
+                        FacilitiesQueryParams.LNG,
+                        FacilitiesQueryParams.RADIUS))
+
+        if radius <= 0:
+            raise ValidationError(
+                '"{}" must be greater than zero.'.format(
+                    FacilitiesQueryParams.RADIUS))
+
+        # The filter is an annotated expression rather than `extra` SQL so
+        # that the table is aliased correctly when the queryset is used as a
+        # subquery, as it is by the facets
+        return self \
+            .annotate(within_radius=Func(
+                as_geography(F('location')),
+                as_geography(make_point(lng, lat)),
+                Value(radius),
+                function='ST_DWithin',
+                output_field=models.BooleanField())) \
+            .filter(within_radius=True)
+
+    def order_by_distance(self, lat, lng):
+        """
+        Return facilities ordered by their distance from the `lat`, `lng`
+        point with the distance, in meters, selected as `distance`. The
+        ordering uses the PostGIS KNN operator on the same geography
+        expression as the GiST index so that the nearest facilities are read
+        directly from the index when the queryset is sliced.
+        """
+        try:
+            lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError):
+            raise ValidationError(
+                '"{}" and "{}" must both be specified as numbers.'
+                .format(FacilitiesQueryParams.LAT,
+                        FacilitiesQueryParams.LNG))
+
+        return self \
+            .annotate(distance=Func(
+                as_geography(F('location')),
+                as_geography(make_point(lng, lat)),
+                template='%(expressions)s',
+                arg_joiner=' <-> ',
+                output_field=models.FloatField())) \
+            .order_by('distance')
+
+    def search(self, text):
+        """
+        Return facilities whose search vector, which covers the canonical and
+        alias names and addresses, matches the words in `text`. Results are
+        ordered by rank, which weights names above addresses and canonical
+        values above aliases.
+        """
+        query = SearchQuery(text, config='simple')
+        return self \
+            .filter(search_vector=query) \
+            .annotate(search_rank=SearchRank(F('search_vector'), query)) \
+            .order_by('-search_rank', 'id')
+
+    def update_summaries(self):
+        """
+        Rebuild the contributor, alias, and search columns of each facility in
+        the queryset from its accepted matches. This is called when a
+        facility, its matches, or the visibility of a matched list changes.
+        """
+        facility_ids_sql, facility_ids_params = \
+            self.values('id').query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                FACILITY_SUMMARY_SQL.format(
+                    facility_ids_sql=facility_ids_sql),
+                facility_ids_params)
+
+    def search_by_name(self, name, min_similarity=None):
+        """
+        Return facilities whose canonical name, or the name of a list item
+        from an active, public list matched to the facility, contains `name`
+        or is similar to it according to pg_trgm. The matching facilities are
+        found with `FACILITY_NAME_SEARCH_SQL`, which is answered from the
+        trigram GIN indexes on the name columns, and only those facilities
+        are scored. Results are ordered from most to least similar.
+
+        If `min_similarity` is specified, only results whose similarity score
+        is at least that value are returned. Note that similarity matches
+        must also pass the `pg_trgm.similarity_threshold` (0.3 by default).
+        """
+        if min_similarity is not None:
+            try:
+                min_similarity = float(min_similarity)
+            except ValueError:
+                raise ValidationError(
+                    '"{}" must be a number.'.format(
+                        FacilitiesQueryParams.MIN_SIMILARITY))
+
+        alias_similarity = FacilityMatch \
+            .objects \
+            .filter(facility=OuterRef('pk')) \
+            .filter(status__in=[FacilityMatch.AUTOMATIC,
+                                FacilityMatch.CONFIRMED]) \
+            .filter(facility_list_item__facility_list__is_active=True) \
+            .filter(facility_list_item__facility_list__is_public=True) \
+            .annotate(similarity=TrigramSimilarity(
+                'facility_list_item__name', name)) \
+            .order_by('-similarity') \
+            .values('similarity')[:1]
+
+        pattern = make_contains_pattern(name)
+        matching_facility_ids = RawSQL(
+            FACILITY_NAME_SEARCH_SQL,
+            [pattern, name, pattern, name,
+             FacilityMatch.AUTOMATIC, FacilityMatch.CONFIRMED])
+
+        queryset = self \
+            .filter(id__in=matching_facility_ids) \
+            .annotate(name_similarity=Greatest(
+                TrigramSimilarity('name', name),
+                Coalesce(Subquery(alias_similarity,
+                                  output_field=models.FloatField()),
+                         0.0)))
+
+        if min_similarity is not None:
+            queryset = queryset.filter(name_similarity__gte=min_similarity)
+
+        return queryset.order_by('-name_similarity', 'id')
+
+
 class Facility(models.Model):
     """
     An official OAR facility. Search results are returned from this table.
     """
     class Meta:
         verbose_name_plural = "facilities"
+        indexes = [
+            models.Index(fields=['created_at', 'id'],
+                         name='api_facility_created_id_idx'),
+            GinIndex(fields=['search_vector'],
+                     name='api_facility_search_idx'),
+            GinIndex(fields=['contributor_ids'],
+                     name='api_facility_contrib_ids_idx'),
+            GinIndex(fields=['contributor_types'],
+                     name='api_facility_contrib_types_idx'),
+        ]
+
+    objects = FacilityQuerySet.as_manager()
 
     id = models.CharField(
         max_length=32,
@@ -349,6 +750,42 @@ class Facility(models.Model):
         related_name='created_facility',
         help_text=('The original uploaded list item from which this facility '
                    'was created.'))
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        help_text=('Full text search index of the names and addresses of the '
+                   'facility and of the list items matched to it.'))
+    contributor_ids = postgres.ArrayField(
+        models.IntegerField(),
+        default=list,
+        editable=False,
+        help_text=('The IDs of the organizations that have contributed a list '
+                   'item matched to the facility.'))
+    contributor_types = postgres.ArrayField(
+        models.TextField(),
+        default=list,
+        editable=False,
+        help_text=('The types of the organizations that have contributed a '
+                   'list item matched to the facility.'))
+    contributor_names = postgres.ArrayField(
+        models.TextField(),
+        default=list,
+        editable=False,
+        help_text=('The organization and list names of the active, public '
+                   'lists that have contributed an item matched to the '
+                   'facility.'))
+    alias_names = postgres.ArrayField(
+        models.TextField(),
+        default=list,
+        editable=False,
+        help_text=('The names, other than the canonical name, of the items in '
+                   'active, public lists matched to the facility.'))
+    alias_addresses = postgres.ArrayField(
+        models.TextField(),
+        default=list,
+        editable=False,
+        help_text=('The addresses, other than the canonical address, of the '
+                   'items in active, public lists matched to the facility.'))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -371,70 +808,13 @@ class Facility(models.Model):
         super(Facility, self).save(*args, **kwargs)
 
     def other_names(self):
-        facility_list_item_matches = [
-            FacilityListItem.objects.get(pk=pk)
-            for (pk,)
-            in self
-            .facilitymatch_set
-            .filter(status__in=[FacilityMatch.AUTOMATIC,
-                                FacilityMatch.CONFIRMED])
-            .values_list('facility_list_item')
-        ]
-
-        return {
-            match.name
-            for match
-            in facility_list_item_matches
-            if len(match.name) != 0
-            and match.name is not None
-            and match.name != self.name
-            and match.facility_list.is_active
-            and match.facility_list.is_public
-        }
+        return self.alias_names
 
     def other_addresses(self):
-        facility_list_item_matches = [
-            FacilityListItem.objects.get(pk=pk)
-            for (pk,)
-            in self
-            .facilitymatch_set
-            .filter(status__in=[FacilityMatch.AUTOMATIC,
-                                FacilityMatch.CONFIRMED])
-            .values_list('facility_list_item')
-        ]
-
-        return {
-            match.address
-            for match
-            in facility_list_item_matches
-            if len(match.address) != 0
-            and match.address is not None
-            and match.address != self.address
-            and match.facility_list.is_active
-            and match.facility_list.is_public
-        }
+        return self.alias_addresses
 
     def contributors(self):
-        facility_list_item_matches = [
-            FacilityListItem.objects.get(pk=pk)
-            for (pk,)
-            in self
-            .facilitymatch_set
-            .filter(status__in=[FacilityMatch.AUTOMATIC,
-                                FacilityMatch.CONFIRMED])
-            .values_list('facility_list_item')
-        ]
-
-        return {
-            "{} ({})".format(
-                match.facility_list.organization.name,
-                match.facility_list.name,
-            )
-            for match
-            in facility_list_item_matches
-            if match.facility_list.is_active
-            and match.facility_list.is_public
-        }
+        return self.contributor_names
 
 
 class FacilityMatch(models.Model):
@@ -443,6 +823,10 @@ class FacilityMatch(models.Model):
     """
     class Meta:
         verbose_name_plural = "facility matches"
+        indexes = [
+            models.Index(fields=['status', 'facility'],
+                         name='api_fm_status_facility_idx'),
+        ]
 
     PENDING = 'PENDING'
     AUTOMATIC = 'AUTOMATIC'
@@ -495,3 +879,85 @@ class FacilityMatch(models.Model):
     def __str__(self):
         return '{0} - {1} - {2}'.format(self.facility_list_item, self.facility,
                                         self.status)
+
+
+class GeocodeCacheEntry(models.Model):
+    """
+    A geocoding result stored so that the same address does not need to be
+    sent to the geocoding API again until the entry expires.
+    """
+    class Meta:
+        verbose_name_plural = "geocode cache entries"
+        unique_together = ('normalized_address', 'country_code')
+        indexes = [
+            models.Index(fields=['expires_at'],
+                         name='api_geocode_cache_expires_idx'),
+        ]
+
+    normalized_address = models.TextField(
+        null=False,
+        blank=False,
+        help_text=('The geocoded address, lower cased and with runs of '
+                   'whitespace replaced by a single space.'))
+    country_code = models.CharField(
+        max_length=2,
+        null=False,
+        blank=False,
+        choices=COUNTRY_CHOICES,
+        help_text='The ISO 3166-1 alpha-2 country code of the address.')
+    geocoded_address = models.TextField(
+        null=False,
+        blank=False,
+        help_text='The formatted address returned by the geocoder.')
+    geocoded_point = gis_models.PointField(
+        null=False,
+        help_text='The lat/lng point returned by the geocoder.')
+    response = postgres.JSONField(
+        help_text=('The geocoder response, reduced to the status and the '
+                   'first result.'))
+    hit_count = models.IntegerField(
+        null=False,
+        default=0,
+        help_text='The number of times the entry has been read.')
+    miss_count = models.IntegerField(
+        null=False,
+        default=0,
+        help_text=('The number of times the address was not found in the '
+                   'cache, or had expired, and was sent to the geocoder.'))
+    last_hit_at = models.DateTimeField(
+        null=True,
+        help_text='When the entry was last read.')
+    expires_at = models.DateTimeField(
+        null=False,
+        help_text='When the entry can no longer be used and can be pruned.')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{normalized_address} ({country_code})'.format(**self.__dict__)
+
+
+class RateLimitBucket(models.Model):
+    """
+    The state of a token bucket shared by every process that calls a rate
+    limited external service, such as the geocoder. Tokens are taken and
+    refilled by `api.ratelimit.acquire_token` with a single statement so
+    that concurrent workers do not exceed the rate between them.
+    """
+    name = models.CharField(
+        max_length=100,
+        null=False,
+        blank=False,
+        unique=True,
+        help_text='The name of the rate limited service.')
+    tokens = models.FloatField(
+        null=False,
+        help_text=('The number of tokens available when the bucket was last '
+                   'updated. Negative when tokens have been reserved by '
+                   'callers that are waiting for them to be refilled.'))
+    updated_at = models.DateTimeField(
+        null=False,
+        help_text='When tokens were last taken from the bucket.')
+
+    def __str__(self):
+        return '{name} ({tokens:.1f} tokens)'.format(**self.__dict__)
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from api.constants import FacilitiesQueryParams
+
+
+class FacilitiesCursorPagination(CursorPagination):
+    """
+    Cursor pagination for the facilities list ordered on `(created_at, id)`.
+    DRF positions the cursor on `created_at` alone, using the index on the
+    ordering, and steps over facilities that share the `created_at` of the
+    cursor with an offset. Facilities are created one at a time, so ties
+    are rare and the offset stays small. Requests that do not include a page
+    size or a cursor are not paginated so that the full registry can still
+    be fetched as a single GeoJSON FeatureCollection.
+
+    The `name` and `q` searches order their results by rank, which the fixed
+    cursor ordering would replace, so they cannot be paginated.
+    """
+    ordering = ('created_at', 'id')
+    cursor_query_param = FacilitiesQueryParams.CURSOR
+    page_size_query_param = FacilitiesQueryParams.PAGE_SIZE
+    page_size = 500
+    max_page_size = 5000
+
+    def get_page_size(self, request):
+        if self.page_size_query_param not in request.query_params \
+           and self.cursor_query_param not in request.query_params:
+            return None
+
+        return super(FacilitiesCursorPagination, self).get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ranked_params = [param
+                         for param in (FacilitiesQueryParams.NAME,
+                                       FacilitiesQueryParams.Q)
+                         if param in request.query_params]
+        if len(ranked_params) and self.get_page_size(request) is not None:
+            raise ValidationError(
+                '"{}" and "{}" cannot be combined with the ranked "{}" '
+                'search.'.format(self.page_size_query_param,
+                                 self.cursor_query_param,
+                                 ranked_params[0]))
+
+        return super(FacilitiesCursorPagination, self).paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('type', 'FeatureCollection'),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('features', data['features']),
+        ]))
@@ -1,15 +1,47 @@
 import csv
+import json
 import traceback
 
 from datetime import datetime
+from itertools import islice
+from queue import Empty, Queue
 from random import sample
+from threading import Lock, Thread
 
+from django.conf import settings
 from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
 
 from api.constants import CsvHeaderField, ProcessingAction
-from api.models import Facility, FacilityMatch, FacilityListItem
+from api.models import (Facility, FacilityMatch, FacilityListItem,
+                        normalize_for_comparison, normalize_text)
 from api.countries import COUNTRY_CODES, COUNTRY_NAMES
-from api.geocoding import geocode_address
+from api.geocoding import cached_geocode_address
+from api.signals import invalidate_facilities_cache
+from api.threads import closing_connection
+
+# Items of a replaced list whose geocoding, or geocoding and matching, results
+# can be inherited by an unchanged row of the list that replaces it
+REUSABLE_GEOCODE_STATUSES = [FacilityListItem.GEOCODED,
+                             FacilityListItem.POTENTIAL_MATCH]
+REUSABLE_MATCH_STATUSES = [FacilityListItem.MATCHED,
+                           FacilityListItem.CONFIRMED_MATCH]
+
+# Django 2.0 does not have `bulk_update`, so the parse results of a batch of
+# items are written with a single UPDATE joined to a VALUES list
+FACILITY_LIST_ITEM_PARSE_UPDATE_SQL = """
+UPDATE api_facilitylistitem SET
+    status = parsed.status,
+    country_code = parsed.country_code,
+    name = parsed.name,
+    address = parsed.address,
+    processing_results = parsed.processing_results::jsonb,
+    updated_at = now()
+FROM (VALUES {values}) AS parsed(
+    id, status, country_code, name, address, processing_results)
+WHERE api_facilitylistitem.id = parsed.id
+"""
 
 
 def parse_csv_line(line):
@@ -28,22 +60,223 @@ def get_country_code(country):
             'Could not find a country code for "{0}".'.format(country))
 
 
-def parse_facility_list_item(item):
+def get_item_content_key(item):
+    """
+    Return a key that is equal for parsed items whose country, name, and
+    address differ only in case or whitespace.
+    """
+    return (item.country_code,
+            normalize_for_comparison(item.name),
+            normalize_for_comparison(item.address))
+
+
+def get_reusable_items(facility_list_id, items):
+    """
+    Return a dictionary mapping the content keys of the parsed `items` to the
+    first item of the list `facility_list_id` with the same content that has
+    been geocoded, and possibly matched, so that its results can be reused
+    by the list that replaces it. Only the candidates whose normalized name
+    appears in `items` are loaded, and only the accepted matches of the items
+    that are returned are fetched.
+    """
+    keys = {get_item_content_key(item) for item in items}
+    if not keys:
+        return {}
+
+    candidates = FacilityListItem \
+        .objects \
+        .annotate(normalized_name=normalize_text(F('name'))) \
+        .filter(facility_list_id=facility_list_id,
+                normalized_name__in={name for _, name, _ in keys},
+                status__in=REUSABLE_GEOCODE_STATUSES
+                + REUSABLE_MATCH_STATUSES) \
+        .only('id', 'status', 'country_code', 'name', 'address',
+              'geocoded_point', 'geocoded_address', 'facility_id') \
+        .order_by('row_index')
+
+    reusable_items = {}
+    for item in candidates:
+        key = get_item_content_key(item)
+        if key in keys:
+            reusable_items.setdefault(key, item)
+
+    prefetch_related_objects(
+        list(reusable_items.values()),
+        Prefetch('facilitymatch_set',
+                 queryset=FacilityMatch.objects.filter(
+                     status__in=[FacilityMatch.AUTOMATIC,
+                                 FacilityMatch.CONFIRMED]),
+                 to_attr='accepted_matches'))
+    return reusable_items
+
+
+def reuse_processing_results(item, previous_item):
+    """
+    Copy the geocoding and, if available, the matching results of
+    `previous_item` to the unsaved, parsed `item` so that they do not need to
+    be calculated again.
+    """
+    now = str(datetime.utcnow())
+    item.geocoded_point = previous_item.geocoded_point
+    item.geocoded_address = previous_item.geocoded_address
+    item.status = FacilityListItem.GEOCODED
+    item.processing_results.append({
+        'action': ProcessingAction.GEOCODE,
+        'started_at': now,
+        'error': False,
+        'reused_from': previous_item.id,
+        'finished_at': now,
+    })
+
+    if previous_item.status in REUSABLE_MATCH_STATUSES:
+        item.facility_id = previous_item.facility_id
+        item.status = previous_item.status
+        item.processing_results.append({
+            'action': ProcessingAction.MATCH,
+            'started_at': now,
+            'error': False,
+            'reused_from': previous_item.id,
+            'finished_at': now,
+        })
+
+
+def copy_accepted_matches(item, previous_item):
+    return [
+        FacilityMatch(facility_list_item_id=item.id,
+                      facility_id=match.facility_id,
+                      results=match.results,
+                      confidence=match.confidence,
+                      status=match.status)
+        for match in previous_item.accepted_matches
+    ]
+
+
+def create_facility_list_items(facility_list, lines, batch_size=None):
+    """
+    Create an UPLOADED `FacilityListItem` for each of the encoded CSV `lines`
+    of `facility_list`. The items are inserted with `bulk_create` in batches
+    of `batch_size`, which defaults to `FACILITY_LIST_ITEM_BATCH_SIZE`, so
+    that only a single batch of items is held in memory at a time. Returns
+    the number of items created.
+
+    If `facility_list` replaces another list, the items are parsed as they
+    are created. Items with the same content as a processed item of the
+    replaced list, which is looked up for each batch, inherit its geocoding
+    results and accepted matches, so that only new or changed rows are sent
+    through the processing pipeline.
+    """
+    if batch_size is None:
+        batch_size = settings.FACILITY_LIST_ITEM_BATCH_SIZE
+
+    replaces_id = facility_list.replaces_id
+    if replaces_id is not None:
+        column_indexes = get_header_column_indexes(facility_list.header)
+
+    items = (
+        FacilityListItem(
+            row_index=idx,
+            facility_list=facility_list,
+            raw_data=line.decode().rstrip())
+        for idx, line in enumerate(lines)
+    )
+
+    count = 0
+    matched_facility_ids = set()
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            break
+
+        reused_items = []
+        if replaces_id is not None:
+            for item in batch:
+                parse_facility_list_item(item, column_indexes)
+            parsed_items = [item for item in batch
+                            if item.status == FacilityListItem.PARSED]
+            reusable_items = get_reusable_items(replaces_id, parsed_items)
+            for item in parsed_items:
+                previous_item = reusable_items.get(get_item_content_key(item))
+                if previous_item is not None:
+                    reuse_processing_results(item, previous_item)
+                    reused_items.append((item, previous_item))
+
+        FacilityListItem.objects.bulk_create(batch)
+        count += len(batch)
+
+        # Matches are built after the items are inserted so that their IDs
+        # are available
+        matches = [
+            match
+            for item, previous_item in reused_items
+            for match in copy_accepted_matches(item, previous_item)
+        ]
+        if matches:
+            FacilityMatch.objects.bulk_create(matches)
+            matched_facility_ids.update(m.facility_id for m in matches)
+
+    # `bulk_create` does not send the signals that maintain the facility
+    # summaries and the facilities cache
+    if matched_facility_ids:
+        Facility \
+            .objects \
+            .filter(id__in=matched_facility_ids) \
+            .update_summaries()
+        invalidate_facilities_cache()
+
+    return count
+
+
+def items_require_processing(facility_list):
+    """
+    Return True if any items of `facility_list` have not yet been matched,
+    either by processing or by reusing the results of a replaced list.
+    """
+    return facility_list \
+        .facilitylistitem_set \
+        .filter(status__in=[FacilityListItem.UPLOADED,
+                            FacilityListItem.PARSED,
+                            FacilityListItem.GEOCODED]) \
+        .exists()
+
+
+def get_header_column_indexes(header):
+    """
+    Return a dictionary mapping each of the country, name, and address fields
+    present in the CSV `header` to the index of its column.
+    """
+    fields = [f.lower() for f in parse_csv_line(header)]
+    return {
+        field: fields.index(field)
+        for field in (CsvHeaderField.COUNTRY,
+                      CsvHeaderField.NAME,
+                      CsvHeaderField.ADDRESS)
+        if field in fields
+    }
+
+
+def parse_facility_list_item(item, column_indexes=None):
+    """
+    Parse the raw data of `item`. `column_indexes`, as returned by
+    `get_header_column_indexes`, can be passed when parsing many items from
+    the same list so that the header is only parsed once.
+    """
     started = str(datetime.utcnow())
     if type(item) != FacilityListItem:
         raise ValueError('Argument must be a FacilityListItem')
     if item.status != FacilityListItem.UPLOADED:
         raise ValueError('Items to be parsed must be in the UPLOADED status')
     try:
-        fields = [f.lower() for f in parse_csv_line(item.facility_list.header)]
+        if column_indexes is None:
+            column_indexes = get_header_column_indexes(
+                item.facility_list.header)
         values = parse_csv_line(item.raw_data)
-        if CsvHeaderField.COUNTRY in fields:
+        if CsvHeaderField.COUNTRY in column_indexes:
             item.country_code = get_country_code(
-                values[fields.index(CsvHeaderField.COUNTRY)])
-        if CsvHeaderField.NAME in fields:
-            item.name = values[fields.index(CsvHeaderField.NAME)]
-        if CsvHeaderField.ADDRESS in fields:
-            item.address = values[fields.index(CsvHeaderField.ADDRESS)]
+                values[column_indexes[CsvHeaderField.COUNTRY]])
+        if CsvHeaderField.NAME in column_indexes:
+            item.name = values[column_indexes[CsvHeaderField.NAME]]
+        if CsvHeaderField.ADDRESS in column_indexes:
+            item.address = values[column_indexes[CsvHeaderField.ADDRESS]]
         item.status = FacilityListItem.PARSED
         item.processing_results.append({
             'action': ProcessingAction.PARSE,
@@ -63,6 +296,64 @@ def parse_facility_list_item(item):
         })
 
 
+def update_parsed_items(items):
+    """
+    Write the parse results of `items` to the database with a single query.
+    """
+    values_sql = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(items))
+    params = [
+        value
+        for item in items
+        for value in (item.id, item.status, item.country_code, item.name,
+                      item.address, json.dumps(item.processing_results))
+    ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            FACILITY_LIST_ITEM_PARSE_UPDATE_SQL.format(values=values_sql),
+            params)
+
+
+def parse_facility_list_items(facility_list, batch_size=None):
+    """
+    Parse every UPLOADED item of `facility_list`. The header is parsed once,
+    the items are read from a server-side cursor, and the results are written
+    back in batches of `batch_size`, which defaults to
+    `FACILITY_LIST_ITEM_BATCH_SIZE`. Returns a dictionary with the number of
+    items that were parsed successfully and that failed.
+    """
+    if batch_size is None:
+        batch_size = settings.FACILITY_LIST_ITEM_BATCH_SIZE
+
+    result = {
+        'success': 0,
+        'failure': 0,
+    }
+
+    column_indexes = get_header_column_indexes(facility_list.header)
+    items = FacilityListItem \
+        .objects \
+        .filter(facility_list=facility_list,
+                status=FacilityListItem.UPLOADED) \
+        .order_by('id') \
+        .iterator(chunk_size=batch_size)
+
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return result
+
+        for item in batch:
+            parse_facility_list_item(item, column_indexes)
+            if item.status == FacilityListItem.ERROR:
+                result['failure'] += 1
+            else:
+                result['success'] += 1
+
+        with transaction.atomic():
+            update_parsed_items(batch)
+
+
 def geocode_facility_list_item(item):
     started = str(datetime.utcnow())
     if type(item) != FacilityListItem:
@@ -70,7 +361,7 @@ def geocode_facility_list_item(item):
     if item.status != FacilityListItem.PARSED:
         raise ValueError('Items to be geocoded must be in the PARSED status')
     try:
-        data = geocode_address(item.address, item.country_code)
+        data = cached_geocode_address(item.address, item.country_code)
         item.status = FacilityListItem.GEOCODED
         item.geocoded_point = Point(
             data["geocoded_point"]["lng"],
@@ -96,6 +387,71 @@ def geocode_facility_list_item(item):
         })
 
 
+def geocode_facility_list_items(items, concurrency=None):
+    """
+    Geocode and save each of `items`, keeping up to `concurrency` geocoding
+    requests in flight at once, and return the number of successes and
+    failures. The rate of requests is limited by the bucket shared by all
+    geocoding workers, so a single process can use the whole quota.
+
+    Each item is saved as soon as it is geocoded, outside of a transaction,
+    so that the rate limit bucket is not held locked while other requests
+    are in flight.
+    """
+    if concurrency is None:
+        concurrency = settings.GEOCODING_CONCURRENCY
+
+    result = {
+        'success': 0,
+        'failure': 0,
+    }
+    result_lock = Lock()
+    errors = []
+
+    pending = Queue()
+    for item in items:
+        pending.put(item)
+
+    def geocode_pending_items():
+        while True:
+            try:
+                item = pending.get_nowait()
+            except Empty:
+                return
+
+            geocode_facility_list_item(item)
+            item.save()
+
+            with result_lock:
+                if item.status == FacilityListItem.ERROR:
+                    result['failure'] += 1
+                else:
+                    result['success'] += 1
+
+    def run_worker():
+        with closing_connection():
+            try:
+                geocode_pending_items()
+            except Exception as e:
+                errors.append(e)
+
+    worker_count = min(concurrency, pending.qsize())
+    if worker_count <= 1:
+        geocode_pending_items()
+        return result
+
+    workers = [Thread(target=run_worker) for _ in range(worker_count)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    if errors:
+        raise errors[0]
+
+    return result
+
+
 def match_facility_list_item(item):
     started = str(datetime.utcnow())
     if type(item) != FacilityListItem:
@@ -0,0 +1,48 @@
+import time
+
+from django.db import connection
+
+# Refills the bucket for the time elapsed since it was last updated, capped
+# at its capacity, and takes one token. The bucket is allowed to go negative
+# so that a caller that finds it empty reserves the next token rather than
+# polling for it, and all callers are served in the order they arrived.
+# clock_timestamp() is used rather than now() so that the elapsed time is
+# correct when called inside a transaction.
+RATE_LIMIT_ACQUIRE_SQL = """
+INSERT INTO api_ratelimitbucket (name, tokens, updated_at)
+VALUES (%(name)s, %(capacity)s - 1, clock_timestamp())
+ON CONFLICT (name) DO UPDATE SET
+    tokens = LEAST(
+        %(capacity)s,
+        api_ratelimitbucket.tokens + %(rate)s * EXTRACT(
+            EPOCH FROM clock_timestamp() - api_ratelimitbucket.updated_at)
+    ) - 1,
+    updated_at = clock_timestamp()
+RETURNING tokens
+"""
+
+
+def acquire_token(name, rate, capacity=None):
+    """
+    Take a token from the bucket called `name`, which is refilled at `rate`
+    tokens per second up to `capacity` tokens, sleeping until the token is
+    available. The bucket is stored in the database so that the rate is
+    shared by every thread and process that uses the same name.
+
+    The bucket row is locked until the calling transaction ends, so this
+    must not be called inside a transaction that is held open while the
+    rate limited request is made.
+    """
+    if capacity is None:
+        capacity = rate
+
+    with connection.cursor() as cursor:
+        cursor.execute(RATE_LIMIT_ACQUIRE_SQL, {
+            'name': name,
+            'rate': rate,
+            'capacity': capacity,
+        })
+        [tokens] = cursor.fetchone()
+
+    if tokens < 0:
+        time.sleep(-tokens / rate)
@@ -84,7 +84,18 @@ class FacilityListSerializer(ModelSerializer):
     class Meta:
         model = FacilityList
         fields = ('id', 'name', 'description', 'file_name', 'is_active',
-                  'is_public')
+                  'is_public', 'ingestion_status')
+
+
+class FacilityListIngestionSerializer(ModelSerializer):
+    item_count = SerializerMethodField()
+
+    class Meta:
+        model = FacilityList
+        fields = ('id', 'ingestion_status', 'ingestion_error', 'item_count')
+
+    def get_item_count(self, facility_list):
+        return facility_list.facilitylistitem_set.count()
 
 
 class FacilitySerializer(GeoFeatureModelSerializer):
@@ -93,6 +104,15 @@ class FacilitySerializer(GeoFeatureModelSerializer):
     other_addresses = SerializerMethodField()
     contributors = SerializerMethodField()
 
+    # The GeoJSON feature ID and geometry are always serialized
+    REQUIRED_FIELDS = ('id', 'location')
+    # The summary columns read by the fields calculated from the matches
+    SUMMARY_FIELD_COLUMNS = {
+        'other_names': 'alias_names',
+        'other_addresses': 'alias_addresses',
+        'contributors': 'contributor_names',
+    }
+
     class Meta:
         model = Facility
         fields = ('id', 'name', 'address', 'country_code', 'location',
@@ -100,6 +120,20 @@ class FacilitySerializer(GeoFeatureModelSerializer):
                   'other_addresses', 'contributors')
         geo_field = 'location'
 
+    def __init__(self, *args, **kwargs):
+        """
+        Accepts an optional `fields` argument that limits serialization to
+        the named fields in addition to the `REQUIRED_FIELDS`.
+        """
+        fields = kwargs.pop('fields', None)
+        super(FacilitySerializer, self).__init__(*args, **kwargs)
+
+        if fields is not None:
+            excluded_fields = set(self.fields.keys()) \
+                - set(fields) - set(self.REQUIRED_FIELDS)
+            for field_name in excluded_fields:
+                self.fields.pop(field_name)
+
     # Added to ensure including the OAR ID in the geojson properties map
     def get_oar_id(self, facility):
         return facility.id
@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from api.cache import bump_facilities_cache_version
+from api.models import Facility, FacilityList, FacilityMatch, Organization
+
+
+def invalidate_facilities_cache():
+    # Wait until the change is visible to other connections so that a
+    # concurrent request can not repopulate the cache with stale data
+    transaction.on_commit(bump_facilities_cache_version)
+
+
+@receiver(post_save, sender=Facility)
+@receiver(post_delete, sender=Facility)
+@receiver(post_save, sender=FacilityMatch)
+@receiver(post_delete, sender=FacilityMatch)
+@receiver(post_save, sender=Organization)
+def facility_data_changed(sender, **kwargs):
+    invalidate_facilities_cache()
+
+
+@receiver(post_save, sender=Facility)
+def facility_saved(sender, instance, **kwargs):
+    Facility.objects.filter(pk=instance.pk).update_summaries()
+
+
+@receiver(post_save, sender=FacilityMatch)
+@receiver(post_delete, sender=FacilityMatch)
+def facility_match_changed(sender, instance, **kwargs):
+    Facility \
+        .objects \
+        .filter(pk=instance.facility_id) \
+        .update_summaries()
+
+
+@receiver(pre_save, sender=Organization)
+def organization_pre_save(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance.summary_changed = False
+        return
+
+    previous = Organization \
+        .objects \
+        .filter(pk=instance.pk) \
+        .values('name', 'org_type') \
+        .first()
+
+    instance.summary_changed = previous is None \
+        or previous['name'] != instance.name \
+        or previous['org_type'] != instance.org_type
+
+
+@receiver(post_save, sender=Organization)
+def organization_post_save(sender, instance, **kwargs):
+    if getattr(instance, 'summary_changed', False):
+        lists = FacilityList.objects.filter(organization=instance)
+        Facility \
+            .objects \
+            .filter(
+                facilitymatch__facility_list_item__facility_list__in=lists) \
+            .update_summaries()
+
+
+@receiver(pre_save, sender=FacilityList)
+def facility_list_pre_save(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance.summary_changed = False
+        return
+
+    previous = FacilityList \
+        .objects \
+        .filter(pk=instance.pk) \
+        .values('is_active', 'is_public', 'name') \
+        .first()
+
+    # The visibility of a list decides whether its contributor is named in
+    # the summaries, and its name is part of the contributor names
+    instance.summary_changed = previous is None \
+        or previous['is_active'] != instance.is_active \
+        or previous['is_public'] != instance.is_public \
+        or previous['name'] != instance.name
+
+
+@receiver(post_save, sender=FacilityList)
+def facility_list_post_save(sender, instance, **kwargs):
+    if getattr(instance, 'summary_changed', False):
+        invalidate_facilities_cache()
+        Facility \
+            .objects \
+            .filter(
+                facilitymatch__facility_list_item__facility_list=instance) \
+            .update_summaries()
@@ -0,0 +1,70 @@
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from api.serializers import FacilitySerializer
+
+FACILITY_STREAM_CHUNK_SIZE = 2000
+
+
+class GeoJSONStreamRenderer(JSONRenderer):
+    """
+    Selects the streaming GeoJSON FeatureCollection output of the facilities
+    list with `?format=geojson-stream`. Responses that are not streamed,
+    such as errors, are rendered as plain JSON.
+    """
+    media_type = 'application/geo+json'
+    format = 'geojson-stream'
+
+
+class NDJSONRenderer(JSONRenderer):
+    """
+    Selects the newline-delimited GeoJSON Feature output of the facilities
+    list with `?format=ndjson`. Responses that are not streamed, such as
+    errors, are rendered as plain JSON.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+STREAMING_RENDERERS = (GeoJSONStreamRenderer, NDJSONRenderer)
+
+
+def iterate_facility_features(queryset, fields=None):
+    """
+    Yield a serialized GeoJSON Feature for each facility in `queryset`,
+    limited to `fields` if specified.
+
+    Facilities are read from a server-side cursor in chunks so that the
+    response does not require the whole result set to be held in memory.
+    """
+    for facility in queryset.iterator(chunk_size=FACILITY_STREAM_CHUNK_SIZE):
+        yield json.dumps(
+            FacilitySerializer(facility, fields=fields).data,
+            cls=JSONEncoder)
+
+
+def stream_geojson(queryset, fields=None):
+    yield '{"type": "FeatureCollection", "features": ['
+    for index, feature in enumerate(
+            iterate_facility_features(queryset, fields)):
+        if index > 0:
+            yield ','
+        yield feature
+    yield ']}'
+
+
+def stream_ndjson(queryset, fields=None):
+    for feature in iterate_facility_features(queryset, fields):
+        yield feature + '\n'
+
+
+def make_streaming_facilities_response(queryset, renderer, fields=None):
+    if isinstance(renderer, NDJSONRenderer):
+        content = stream_ndjson(queryset, fields)
+    else:
+        content = stream_geojson(queryset, fields)
+
+    return StreamingHttpResponse(content, content_type=renderer.media_type)
@@ -1,8 +1,23 @@
+import copy
+import gzip
+import io
 import json
+import os
+import tempfile
+import zipfile
+
+from datetime import timedelta
+from unittest import mock
+
+import requests
 
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib import auth
 from django.conf import settings
 from django.contrib.gis.geos import Point
@@ -11,15 +26,27 @@ from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
+from api.cache import (get_facilities_cache,
+                       get_facilities_cache_version)
 from api.constants import ProcessingAction
 from api.models import (Facility, FacilityList, FacilityListItem,
-                        FacilityMatch, Organization, User)
-from api.processing import (parse_facility_list_item,
+                        FacilityMatch, GeocodeCacheEntry, Organization,
+                        RateLimitBucket, User)
+from api.processing import (create_facility_list_items,
+                            get_reusable_items,
+                            parse_facility_list_item,
+                            parse_facility_list_items,
                             geocode_facility_list_item,
+                            geocode_facility_list_items,
                             match_facility_list_item)
-from api.geocoding import (create_geocoding_api_url,
+from api.ingestion import ingest_facility_list
+from api.ratelimit import acquire_token
+from api.threads import closing_connection
+from api.geocoding import (cached_geocode_address,
+                           create_geocoding_api_url,
                            format_geocoded_address_data,
-                           geocode_address)
+                           geocode_address,
+                           request_geocoding_api)
 from api.test_data import azavea_office_data, parsed_city_hall_data
 
 
@@ -73,6 +100,185 @@ class FacilityListCreateTest(APITestCase):
         items = list(FacilityListItem.objects.all())
         self.assertEqual(items[1].raw_data, self.test_csv_rows[1])
 
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_creates_items_from_file_spooled_to_disk(self):
+        response = self.client.post(reverse('facility-list-list'),
+                                    {'file': self.test_file},
+                                    format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        items = FacilityListItem.objects.order_by('row_index')
+        self.assertEqual([item.raw_data for item in items],
+                         self.test_csv_rows)
+
+    def post_file(self, name, content):
+        csv_file = SimpleUploadedFile(name, content,
+                                      content_type='application/octet-stream')
+        return self.client.post(reverse('facility-list-list'),
+                                {'file': csv_file},
+                                format='multipart')
+
+    def get_csv_content(self):
+        return b'\n'.join([s.encode() for s in self.test_csv_rows])
+
+    def assert_items_created(self):
+        items = FacilityListItem.objects.order_by('row_index')
+        self.assertEqual([item.raw_data for item in items],
+                         self.test_csv_rows)
+
+    def test_creates_items_from_gzip_file(self):
+        response = self.post_file('facilities.csv.gz',
+                                  gzip.compress(self.get_csv_content()))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assert_items_created()
+
+    def test_creates_items_from_zip_file(self):
+        content = io.BytesIO()
+        with zipfile.ZipFile(content, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('facilities.csv', self.get_csv_content())
+        response = self.post_file('facilities.zip', content.getvalue())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assert_items_created()
+
+    def test_zip_file_must_contain_one_file(self):
+        content = io.BytesIO()
+        with zipfile.ZipFile(content, 'w') as archive:
+            archive.writestr('one.csv', self.get_csv_content())
+            archive.writestr('two.csv', self.get_csv_content())
+        response = self.post_file('facilities.zip', content.getvalue())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content),
+                         ['Uploaded zip files must contain exactly one file.'])
+
+    @override_settings(MAX_UPLOADED_FILE_SIZE_IN_BYTES=1024)
+    def test_decompressed_size_is_limited(self):
+        content = self.get_csv_content() + b'\n' + b'US,a,b\n' * 1000
+        response = self.post_file('facilities.csv.gz', gzip.compress(content))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(FacilityList.objects.count(), 0)
+
+    def post_async(self):
+        return self.client.post(reverse('facility-list-list'),
+                                {'file': self.test_file, 'async': 'true'},
+                                format='multipart')
+
+    @override_settings(
+        FACILITY_LIST_INGESTION_WORKER='api.ingestion.SynchronousIngestionWorker')  # NOQA
+    @mock.patch('api.ingestion.transaction.on_commit', lambda f: f())
+    def test_async_upload_is_ingested_by_worker(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            response = self.post_async()
+            self.assertEqual(response.status_code,
+                             status.HTTP_202_ACCEPTED)
+
+            response = self.client.get(response['Location'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = json.loads(response.content)
+            self.assertEqual(data['ingestion_status'], FacilityList.COMPLETE)
+            self.assertEqual(data['item_count'], len(self.test_csv_rows))
+
+            facility_list = FacilityList.objects.get(pk=data['id'])
+            self.assertFalse(facility_list.file)
+
+    def test_async_upload_returns_before_ingestion(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            response = self.post_async()
+            self.assertEqual(response.status_code,
+                             status.HTTP_202_ACCEPTED)
+            self.assertEqual(json.loads(response.content)['ingestion_status'],
+                             FacilityList.PENDING)
+
+            data = json.loads(self.client.get(response['Location']).content)
+            self.assertEqual(data['ingestion_status'], FacilityList.PENDING)
+            self.assertEqual(data['item_count'], 0)
+
+    def test_failed_ingestion_is_recorded(self):
+        facility_list = FacilityList \
+            .objects \
+            .create(header='header',
+                    file_name='one',
+                    name='one',
+                    organization=self.organization,
+                    file='facility_lists/missing.csv',
+                    ingestion_status=FacilityList.PENDING)
+
+        ingest_facility_list(facility_list.id)
+
+        facility_list.refresh_from_db()
+        self.assertEqual(facility_list.ingestion_status, FacilityList.ERROR)
+        self.assertIsNotNone(facility_list.ingestion_error)
+        self.assertFalse(facility_list.file)
+
+    @override_settings(
+        FACILITY_LIST_INGESTION_WORKER='api.ingestion.SynchronousIngestionWorker')  # NOQA
+    @mock.patch('api.ingestion.transaction.on_commit', lambda f: f())
+    @mock.patch('api.ingestion.create_facility_list_items',
+                side_effect=ValueError('Invalid file'))
+    def test_failed_ingestion_deletes_upload(self, create_items):
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            response = self.post_async()
+            self.assertEqual(response.status_code,
+                             status.HTTP_202_ACCEPTED)
+
+            data = json.loads(self.client.get(response['Location']).content)
+            self.assertEqual(data['ingestion_status'], FacilityList.ERROR)
+            self.assertEqual(
+                os.listdir(os.path.join(media_root, 'facility_lists')), [])
+
+    def test_stalled_ingestions_are_recovered(self):
+        def create_list(name, ingestion_status):
+            return FacilityList \
+                .objects \
+                .create(header='header',
+                        file_name=name,
+                        name=name,
+                        organization=self.organization,
+                        file='facility_lists/missing.csv',
+                        ingestion_status=ingestion_status)
+
+        never_started = create_list('one', FacilityList.PENDING)
+        interrupted = create_list('two', FacilityList.INGESTING)
+        recent = create_list('three', FacilityList.PENDING)
+        FacilityList \
+            .objects \
+            .exclude(pk=recent.pk) \
+            .update(updated_at=timezone.now() - timedelta(hours=1))
+
+        with mock.patch('api.ingestion.ingest_facility_list') as ingest:
+            call_command('recoverfacilitylistingestion', timeout=30,
+                         stdout=mock.Mock())
+
+        ingest.assert_called_once_with(never_started.id)
+        interrupted.refresh_from_db()
+        self.assertEqual(interrupted.ingestion_status, FacilityList.ERROR)
+        self.assertIsNotNone(interrupted.ingestion_error)
+        self.assertFalse(interrupted.file)
+        recent.refresh_from_db()
+        self.assertEqual(recent.ingestion_status, FacilityList.PENDING)
+
+    @override_settings(FACILITY_LIST_ITEM_BATCH_SIZE=2)
+    def test_items_are_inserted_in_batches(self):
+        facility_list = FacilityList \
+            .objects \
+            .create(header='header',
+                    file_name='one',
+                    name='one',
+                    organization=self.organization)
+        lines = [row.encode() + b'\n' for row in self.test_csv_rows]
+
+        with self.assertNumQueries(2):
+            count = create_facility_list_items(facility_list, lines)
+
+        self.assertEqual(count, len(self.test_csv_rows))
+        self.assertEqual(
+            list(facility_list
+                 .facilitylistitem_set
+                 .order_by('row_index')
+                 .values_list('raw_data', flat=True)),
+            self.test_csv_rows)
+
     def test_file_required(self):
         response = self.client.post(reverse('facility-list-list'))
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -187,6 +393,37 @@ class FacilityListCreateTest(APITestCase):
         self.assertEqual(FacilityList.objects.all().count(),
                          previous_list_count + 2)
 
+    @override_settings(
+        FACILITY_LIST_INGESTION_WORKER='api.ingestion.SynchronousIngestionWorker')  # NOQA
+    @mock.patch('api.ingestion.transaction.on_commit', lambda f: f())
+    def test_failed_async_replacement_keeps_replaced_list_active(self):
+        response = self.post_header_only_file()
+        original_list = FacilityList.objects.get(
+            pk=json.loads(response.content)['id'])
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root), \
+                mock.patch('api.ingestion.create_facility_list_items',
+                           side_effect=ValueError('Ingestion failed')):
+            response = self.client.post(reverse('facility-list-list'),
+                                        {'file': self.test_file,
+                                         'async': 'true',
+                                         'replaces': original_list.id},
+                                        format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        failed_list = FacilityList.objects.get(
+            pk=json.loads(response.content)['id'])
+        self.assertEqual(failed_list.ingestion_status, FacilityList.ERROR)
+
+        original_list.refresh_from_db()
+        self.assertTrue(original_list.is_active)
+
+        # The list can still be replaced by a new upload
+        response = self.post_header_only_file(replaces=original_list.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        original_list.refresh_from_db()
+        self.assertFalse(original_list.is_active)
+
     def test_user_must_be_authenticated(self):
         self.client.post('/user-logout/')
         response = self.client.post(reverse('facility-list-list'),
@@ -321,6 +558,34 @@ class FacilityListItemParseTest(ProcessingTestCase):
         self.assert_failed_parse_results(
             item, 'Could not find a country code for "Unknownistan".')
 
+    def test_parses_all_uploaded_items_of_list(self):
+        user = User.objects.create(email='parse@example.com')
+        organization = Organization.objects.create(name='org', admin=user)
+        facility_list = FacilityList.objects.create(
+            header='address,country,name',
+            file_name='one',
+            name='one',
+            organization=organization)
+        create_facility_list_items(
+            facility_list,
+            [b'address,country,name',
+             b'1234 main st,de,Shirts!',
+             b'99 rue de la paix,Unknownistan,Pants!'],
+            batch_size=2)
+
+        result = parse_facility_list_items(facility_list, batch_size=2)
+
+        self.assertEqual(result, {'success': 1, 'failure': 2})
+        header, item, unknown = facility_list \
+            .facilitylistitem_set \
+            .order_by('row_index')
+        self.assert_successful_parse_results(item)
+        self.assertEqual('DE', item.country_code)
+        self.assertEqual('Shirts!', item.name)
+        self.assertEqual('1234 main st', item.address)
+        self.assert_failed_parse_results(
+            unknown, 'Could not find a country code for "Unknownistan".')
+
 
 class UserTokenGenerationTest(TestCase):
     def setUp(self):
@@ -383,6 +648,123 @@ class GeocodingTest(TestCase):
         self.assertEqual(cm.exception.args, ('No results were found',))
 
 
+@override_settings(GEOCODING_MAX_RETRIES=2)
+class GeocodingRetryTest(TestCase):
+    def setUp(self):
+        session_patcher = mock.patch('api.geocoding.get_geocoding_session')
+        self.session = session_patcher.start().return_value
+        self.addCleanup(session_patcher.stop)
+
+        sleep_patcher = mock.patch('api.geocoding.time.sleep')
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def make_response(self, status_code, data=None):
+        response = mock.Mock(status_code=status_code)
+        response.json.return_value = data
+        return response
+
+    def test_transient_failures_are_retried(self):
+        self.session.get.side_effect = [
+            self.make_response(503),
+            self.make_response(200, {'status': 'OVER_QUERY_LIMIT'}),
+            self.make_response(200, {'status': 'OK', 'results': []}),
+        ]
+
+        data = request_geocoding_api('https://example.com')
+
+        self.assertEqual(data['status'], 'OK')
+        self.assertEqual(self.session.get.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_error_is_raised_when_retries_are_exhausted(self):
+        self.session.get.side_effect = requests.Timeout('timed out')
+
+        with self.assertRaises(ValueError):
+            request_geocoding_api('https://example.com')
+
+        self.assertEqual(self.session.get.call_count, 3)
+
+    def test_permanent_failures_are_not_retried(self):
+        self.session.get.return_value = self.make_response(403)
+
+        with self.assertRaises(ValueError) as cm:
+            request_geocoding_api('https://example.com')
+
+        self.assertEqual(cm.exception.args,
+                         ('Geocoding request failed with status 403',))
+        self.assertEqual(self.session.get.call_count, 1)
+
+
+class GeocodeCacheTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            'api.geocoding.geocode_address',
+            side_effect=lambda *args: copy.deepcopy(parsed_city_hall_data))
+        self.geocode_address = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_request_is_read_from_cache(self):
+        first = cached_geocode_address('City Hall, Philly, PA', 'US')
+        second = cached_geocode_address(' city hall,  PHILLY, pa', 'US')
+
+        self.assertEqual(self.geocode_address.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(second['geocoded_address'],
+                         parsed_city_hall_data['geocoded_address'])
+        self.assertEqual(len(second['full_response']['results']), 1)
+
+        entry = GeocodeCacheEntry.objects.get()
+        self.assertEqual(entry.hit_count, 1)
+        self.assertEqual(entry.miss_count, 1)
+
+    def test_country_is_part_of_key(self):
+        cached_geocode_address('City Hall', 'US')
+        cached_geocode_address('City Hall', 'CA')
+        self.assertEqual(self.geocode_address.call_count, 2)
+
+    def test_expired_entry_is_refreshed(self):
+        cached_geocode_address('City Hall', 'US')
+        GeocodeCacheEntry.objects.update(expires_at=timezone.now())
+
+        cached_geocode_address('City Hall', 'US')
+
+        self.assertEqual(self.geocode_address.call_count, 2)
+        entry = GeocodeCacheEntry.objects.get()
+        self.assertEqual(entry.miss_count, 2)
+        self.assertGreater(entry.expires_at, timezone.now())
+
+    @mock.patch('api.geocoding.cache_geocoded_address_data')
+    def test_cache_failure_does_not_fail_geocoding(self, cache_data):
+        def fail(*args):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1/0')
+        cache_data.side_effect = fail
+
+        with self.assertLogs('api.geocoding', level='ERROR'):
+            data = cached_geocode_address('City Hall', 'US')
+
+        self.assertEqual(data['geocoded_address'],
+                         parsed_city_hall_data['geocoded_address'])
+        # The failed write did not break the enclosing transaction
+        self.assertEqual(GeocodeCacheEntry.objects.count(), 0)
+
+    def test_prune_deletes_expired_entries(self):
+        cached_geocode_address('City Hall', 'US')
+        cached_geocode_address('City Hall', 'CA')
+        GeocodeCacheEntry \
+            .objects \
+            .filter(country_code='CA') \
+            .update(expires_at=timezone.now())
+
+        call_command('prunegeocodecache', stdout=mock.Mock())
+
+        self.assertEqual(
+            list(GeocodeCacheEntry.objects.values_list('country_code',
+                                                       flat=True)),
+            ['US'])
+
+
 class FacilityListItemGeocodingTest(ProcessingTestCase):
     def test_invalid_argument_raises_error(self):
         with self.assertRaises(ValueError) as cm:
@@ -447,6 +829,112 @@ class FacilityListItemGeocodingTest(ProcessingTestCase):
         )
 
 
+class FacilityListItemsGeocodingTestMixin:
+    def create_parsed_items(self):
+        user = User.objects.create(email='geocode@example.com')
+        organization = Organization.objects.create(name='org', admin=user)
+        facility_list = FacilityList.objects.create(
+            header='address,country,name',
+            file_name='one',
+            name='one',
+            organization=organization)
+        create_facility_list_items(
+            facility_list,
+            [b'address,country,name',
+             b'City Hall,us,Shirts!',
+             b'Nowhere,us,Pants!',
+             b'City Hall,us,Socks!'])
+        parse_facility_list_items(facility_list)
+        return facility_list \
+            .facilitylistitem_set \
+            .filter(status=FacilityListItem.PARSED)
+
+    def geocode_address(self, address, country_code):
+        if address == 'Nowhere':
+            raise ValueError('No results were found')
+        return copy.deepcopy(parsed_city_hall_data)
+
+    def assert_items_geocoded(self, result):
+        self.assertEqual(result, {'success': 2, 'failure': 1})
+        statuses = dict(FacilityListItem
+                        .objects
+                        .exclude(row_index=0)
+                        .values_list('address', 'status'))
+        self.assertEqual(statuses, {
+            'City Hall': FacilityListItem.GEOCODED,
+            'Nowhere': FacilityListItem.ERROR,
+        })
+
+
+class FacilityListItemsGeocodingTest(FacilityListItemsGeocodingTestMixin,
+                                     TestCase):
+    @mock.patch('api.processing.cached_geocode_address')
+    def test_geocodes_and_saves_items(self, cached_geocode_address):
+        cached_geocode_address.side_effect = self.geocode_address
+        items = self.create_parsed_items()
+
+        result = geocode_facility_list_items(items, concurrency=1)
+
+        self.assert_items_geocoded(result)
+
+    @mock.patch.dict('os.environ', {'AWS_BATCH_JOB_ARRAY_INDEX': '1'})
+    @mock.patch('api.management.commands.batch_process.'
+                'geocode_facility_list_items')
+    def test_array_job_geocodes_outside_transaction(self, geocode_items):
+        geocode_items.return_value = {'success': 1, 'failure': 0}
+        items = self.create_parsed_items()
+
+        call_command('batch_process',
+                     '--action', 'geocode',
+                     '--list-id', str(items[0].facility_list_id),
+                     stdout=mock.Mock())
+
+        [geocoded_items, _], _ = geocode_items.call_args
+        self.assertEqual([item.row_index for item in geocoded_items], [1])
+
+
+class ConcurrentFacilityListItemsGeocodingTest(
+        FacilityListItemsGeocodingTestMixin, TransactionTestCase):
+    # The worker threads use their own connections, so the items must be
+    # committed for them to be visible
+    @mock.patch('api.processing.cached_geocode_address')
+    def test_geocodes_and_saves_items_in_threads(self,
+                                                 cached_geocode_address):
+        cached_geocode_address.side_effect = self.geocode_address
+        items = self.create_parsed_items()
+
+        result = geocode_facility_list_items(items, concurrency=3)
+
+        self.assert_items_geocoded(result)
+        self.assertEqual(cached_geocode_address.call_count, 3)
+
+
+class RateLimitTest(TestCase):
+    @mock.patch('api.ratelimit.time.sleep')
+    def test_tokens_are_taken_until_bucket_is_empty(self, sleep):
+        acquire_token('test', rate=1, capacity=2)
+        acquire_token('test', rate=1, capacity=2)
+        sleep.assert_not_called()
+
+        acquire_token('test', rate=1, capacity=2)
+
+        sleep.assert_called_once()
+        [delay], _ = sleep.call_args
+        self.assertGreater(delay, 0)
+        self.assertLessEqual(delay, 1)
+        self.assertLess(RateLimitBucket.objects.get(name='test').tokens, 0)
+
+    @mock.patch('api.ratelimit.time.sleep')
+    def test_waiting_callers_reserve_successive_tokens(self, sleep):
+        acquire_token('test', rate=10, capacity=1)
+        acquire_token('test', rate=10, capacity=1)
+        acquire_token('test', rate=10, capacity=1)
+
+        [first], _ = sleep.call_args_list[0]
+        [second], _ = sleep.call_args_list[1]
+        self.assertGreater(second, first)
+
+
 class FacilityListItemMatchingTest(TestCase):
     def test_invalid_argument_raises_error(self):
         with self.assertRaises(ValueError) as ve:
@@ -561,6 +1049,9 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
                     results="",
                     facility_list_item=self.list_item_two)
 
+        # The summary columns are updated in the database as matches change
+        self.facility.refresh_from_db()
+
     def test_returns_contributors(self):
         contributors = self.facility.contributors()
         contributor_one = "{} ({})".format(self.org_one_name,
@@ -584,6 +1075,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_other_names_from_inactive_lists(self):
         self.list_two.is_active = False
         self.list_two.save()
+        self.facility.refresh_from_db()
         other_names = self.facility.other_names()
         self.assertNotIn(self.name_two, other_names)
         self.assertEqual(len(other_names), 0)
@@ -591,6 +1083,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_other_addresses_from_inactive_lists(self):
         self.list_two.is_active = False
         self.list_two.save()
+        self.facility.refresh_from_db()
         other_addresses = self.facility.other_addresses()
         self.assertNotIn(self.address_two, other_addresses)
         self.assertEqual(len(other_addresses), 0)
@@ -598,6 +1091,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_contributors_from_inactive_lists(self):
         self.list_two.is_active = False
         self.list_two.save()
+        self.facility.refresh_from_db()
         contributors = self.facility.contributors()
         contributor_one = "{} ({})".format(self.org_one_name,
                                            self.list_one_name)
@@ -609,6 +1103,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_other_names_from_non_public_lists(self):
         self.list_two.is_public = False
         self.list_two.save()
+        self.facility.refresh_from_db()
         other_names = self.facility.other_names()
         self.assertNotIn(self.name_two, other_names)
         self.assertEqual(len(other_names), 0)
@@ -616,6 +1111,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_other_addresses_from_non_public_lists(self):
         self.list_two.is_public = False
         self.list_two.save()
+        self.facility.refresh_from_db()
         other_addresses = self.facility.other_addresses()
         self.assertNotIn(self.address_two, other_addresses)
         self.assertEqual(len(other_addresses), 0)
@@ -623,6 +1119,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_contributors_from_non_public_lists(self):
         self.list_two.is_public = False
         self.list_two.save()
+        self.facility.refresh_from_db()
         contributors = self.facility.contributors()
         contributor_one = "{} ({})".format(self.org_one_name,
                                            self.list_one_name)
@@ -634,6 +1131,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_unmatched_facilities_from_other_names(self):
         self.facility_match_two.status = FacilityMatch.REJECTED
         self.facility_match_two.save()
+        self.facility.refresh_from_db()
         other_names = self.facility.other_names()
         self.assertNotIn(self.name_two, other_names)
         self.assertEqual(len(other_names), 0)
@@ -641,6 +1139,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_unmatched_facilities_from_other_addresses(self):
         self.facility_match_two.status = FacilityMatch.REJECTED
         self.facility_match_two.save()
+        self.facility.refresh_from_db()
         other_addresses = self.facility.other_addresses()
         self.assertNotIn(self.name_one, other_addresses)
         self.assertEqual(len(other_addresses), 0)
@@ -648,6 +1147,7 @@ class FacilityNamesAddressesAndContributorsTest(TestCase):
     def test_excludes_unmatched_facilities_from_contributors(self):
         self.facility_match_two.status = FacilityMatch.REJECTED
         self.facility_match_two.save()
+        self.facility.refresh_from_db()
         contributors = self.facility.contributors()
         contributor_one = "{} ({})".format(self.org_one_name,
                                            self.list_one_name)
@@ -921,3 +1421,921 @@ class ConfirmAndRejectFacilityMatchTest(TestCase):
 
         facilities = Facility.objects.all()
         self.assertEqual(facilities.count(), 3)
+
+
+class FacilityAPITestCase(APITestCase):
+    def setUp(self):
+        # Changes made in a test case are rolled back without committing, so
+        # cached responses would otherwise leak between tests
+        get_facilities_cache().clear()
+
+        self.user_one = User.objects.create(email='one@example.com')
+        self.user_two = User.objects.create(email='two@example.com')
+
+        self.org_one = Organization \
+            .objects \
+            .create(admin=self.user_one,
+                    name='organization one',
+                    org_type='Auditor')
+
+        self.org_two = Organization \
+            .objects \
+            .create(admin=self.user_two,
+                    name='organization two',
+                    org_type='Brand/Retailer')
+
+        self.list_one = FacilityList \
+            .objects \
+            .create(header='header',
+                    file_name='one',
+                    name='one',
+                    is_active=True,
+                    is_public=True,
+                    organization=self.org_one)
+
+        self.list_two = FacilityList \
+            .objects \
+            .create(header='header',
+                    file_name='two',
+                    name='two',
+                    is_active=True,
+                    is_public=True,
+                    organization=self.org_two)
+
+        self.list_item_one = FacilityListItem \
+            .objects \
+            .create(name='Shirt Factory',
+                    address='1234 Main St',
+                    country_code='US',
+                    facility_list=self.list_one,
+                    row_index=1,
+                    geocoded_point=Point(-75.16, 39.95),
+                    status=FacilityListItem.MATCHED)
+
+        self.list_item_two = FacilityListItem \
+            .objects \
+            .create(name='Pants Factory',
+                    address='99 Rue de la Paix',
+                    country_code='FR',
+                    facility_list=self.list_two,
+                    row_index=1,
+                    geocoded_point=Point(2.33, 48.87),
+                    status=FacilityListItem.MATCHED)
+
+        self.facility_one = Facility \
+            .objects \
+            .create(name=self.list_item_one.name,
+                    address=self.list_item_one.address,
+                    country_code=self.list_item_one.country_code,
+                    location=self.list_item_one.geocoded_point,
+                    created_from=self.list_item_one)
+
+        self.facility_two = Facility \
+            .objects \
+            .create(name=self.list_item_two.name,
+                    address=self.list_item_two.address,
+                    country_code=self.list_item_two.country_code,
+                    location=self.list_item_two.geocoded_point,
+                    created_from=self.list_item_two)
+
+        self.match_one = FacilityMatch \
+            .objects \
+            .create(status=FacilityMatch.AUTOMATIC,
+                    facility=self.facility_one,
+                    results='',
+                    facility_list_item=self.list_item_one)
+
+        self.match_two = FacilityMatch \
+            .objects \
+            .create(status=FacilityMatch.AUTOMATIC,
+                    facility=self.facility_two,
+                    results='',
+                    facility_list_item=self.list_item_two)
+
+    def get_facility_ids(self, query_string):
+        response = self.client.get('/api/facilities/?{}'.format(query_string))
+        self.assertEqual(response.status_code, 200)
+        return [f['id'] for f in json.loads(response.content)['features']]
+
+
+class FacilityVectorTileTest(FacilityAPITestCase):
+    def test_world_tile_contains_facilities(self):
+        response = self.client.get('/api/facilities/tiles/0/0/0.pbf')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         'application/vnd.mapbox-vector-tile')
+        self.assertGreater(len(response.content), 0)
+        self.assertIn(self.facility_one.id.encode(), response.content)
+        self.assertIn(self.facility_two.id.encode(), response.content)
+
+    def test_tile_excludes_facilities_outside_bounds(self):
+        # The z1 north-west tile covers the United States but not France
+        response = self.client.get('/api/facilities/tiles/1/0/0.pbf')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.facility_one.id.encode(), response.content)
+        self.assertNotIn(self.facility_two.id.encode(), response.content)
+
+    def test_tile_applies_facility_filters(self):
+        response = self.client.get(
+            '/api/facilities/tiles/0/0/0.pbf?countries=FR')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.facility_one.id.encode(), response.content)
+        self.assertIn(self.facility_two.id.encode(), response.content)
+
+    def test_invalid_tile_returns_404(self):
+        response = self.client.get('/api/facilities/tiles/1/2/0.pbf')
+        self.assertEqual(response.status_code, 404)
+
+
+class FacilitiesPaginationTest(FacilityAPITestCase):
+    def test_unpaginated_request_returns_all_facilities(self):
+        response = self.client.get('/api/facilities/')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(len(data['features']), 2)
+        self.assertNotIn('next', data)
+
+    def test_page_size_paginates_by_creation_order(self):
+        response = self.client.get('/api/facilities/?page_size=1')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual(len(data['features']), 1)
+        self.assertEqual(data['features'][0]['id'], self.facility_one.id)
+        self.assertIsNone(data['previous'])
+        self.assertIsNotNone(data['next'])
+
+        response = self.client.get(data['next'])
+        data = json.loads(response.content)
+        self.assertEqual(len(data['features']), 1)
+        self.assertEqual(data['features'][0]['id'], self.facility_two.id)
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+    def test_pagination_applies_filters(self):
+        response = self.client.get(
+            '/api/facilities/?page_size=1&countries=FR')
+        data = json.loads(response.content)
+        self.assertEqual(len(data['features']), 1)
+        self.assertEqual(data['features'][0]['id'], self.facility_two.id)
+        self.assertIsNone(data['next'])
+
+    def test_ranked_search_cannot_be_paginated(self):
+        for search in ('name=one', 'q=one'):
+            response = self.client.get(
+                '/api/facilities/?page_size=1&{}'.format(search))
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/facilities/?name=one')
+        self.assertEqual(response.status_code, 200)
+
+
+class FacilitySerializerQueryCountTest(FacilityAPITestCase):
+    def setUp(self):
+        super(FacilitySerializerQueryCountTest, self).setUp()
+        self.alias_item = FacilityListItem \
+            .objects \
+            .create(name='Shirt Factory Inc',
+                    address='1234 Main Street',
+                    country_code='US',
+                    facility_list=self.list_two,
+                    row_index=2,
+                    geocoded_point=Point(-75.16, 39.95),
+                    status=FacilityListItem.MATCHED)
+        FacilityMatch \
+            .objects \
+            .create(status=FacilityMatch.CONFIRMED,
+                    facility=self.facility_one,
+                    results='',
+                    facility_list_item=self.alias_item)
+
+    def test_list_uses_constant_number_of_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/facilities/')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.content)
+        properties = next(
+            f['properties'] for f in data['features']
+            if f['id'] == self.facility_one.id)
+        self.assertEqual(properties['other_names'], ['Shirt Factory Inc'])
+        self.assertEqual(properties['other_addresses'], ['1234 Main Street'])
+        self.assertEqual(len(properties['contributors']), 2)
+
+
+class FacilityNameSearchTest(FacilityAPITestCase):
+    def setUp(self):
+        super(FacilityNameSearchTest, self).setUp()
+        self.alias_item = FacilityListItem \
+            .objects \
+            .create(name='Garment Works',
+                    address='1234 Main Street',
+                    country_code='US',
+                    facility_list=self.list_two,
+                    row_index=2,
+                    geocoded_point=Point(-75.16, 39.95),
+                    status=FacilityListItem.MATCHED)
+        FacilityMatch \
+            .objects \
+            .create(status=FacilityMatch.CONFIRMED,
+                    facility=self.facility_one,
+                    results='',
+                    facility_list_item=self.alias_item)
+
+    def test_substring_search(self):
+        self.assertEqual(self.get_facility_ids('name=pants'),
+                         [self.facility_two.id])
+
+    def test_misspelled_name_search(self):
+        facility_ids = self.get_facility_ids('name=Shrit Factory')
+        self.assertEqual(facility_ids[0], self.facility_one.id)
+
+    def test_search_by_alias_name(self):
+        self.assertEqual(self.get_facility_ids('name=Garment Works'),
+                         [self.facility_one.id])
+
+    def test_alias_names_from_non_public_lists_are_not_searched(self):
+        self.list_two.is_public = False
+        self.list_two.save()
+        self.assertEqual(self.get_facility_ids('name=Garment Works'), [])
+
+    def test_results_are_ordered_by_similarity(self):
+        self.assertEqual(self.get_facility_ids('name=Pants Factory'),
+                         [self.facility_two.id, self.facility_one.id])
+
+    def test_min_similarity(self):
+        self.assertEqual(
+            self.get_facility_ids('name=Pants Factory&min_similarity=0.9'),
+            [self.facility_two.id])
+
+    def test_invalid_min_similarity(self):
+        response = self.client.get(
+            '/api/facilities/?name=Pants&min_similarity=high')
+        self.assertEqual(response.status_code, 400)
+
+    def test_like_wildcards_are_escaped(self):
+        self.assertEqual(self.get_facility_ids('name=%25'), [])
+
+    def test_search_uses_trigram_indexes(self):
+        sql, params = Facility \
+            .objects \
+            .search_by_name('shirt') \
+            .query \
+            .sql_with_params()
+
+        with connection.cursor() as cursor:
+            # The test tables are small enough that a sequential scan would
+            # otherwise always be chosen
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('api_facility_name_trgm_idx', plan)
+        self.assertIn('api_fli_name_trgm_idx', plan)
+        self.assertNotIn('Seq Scan on api_facility ', plan)
+
+
+class FacilityClustersTest(FacilityAPITestCase):
+    def setUp(self):
+        super(FacilityClustersTest, self).setUp()
+        self.nearby_item = FacilityListItem \
+            .objects \
+            .create(name='Sock Factory',
+                    address='1300 Main St',
+                    country_code='US',
+                    facility_list=self.list_one,
+                    row_index=2,
+                    geocoded_point=Point(-75.15, 39.96),
+                    status=FacilityListItem.MATCHED)
+        self.nearby_facility = Facility \
+            .objects \
+            .create(name=self.nearby_item.name,
+                    address=self.nearby_item.address,
+                    country_code=self.nearby_item.country_code,
+                    location=self.nearby_item.geocoded_point,
+                    created_from=self.nearby_item)
+
+    def get_clusters(self, query_string):
+        response = self.client.get(
+            '/api/facilities/clusters/?{}'.format(query_string))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_nearby_facilities_are_clustered(self):
+        data = self.get_clusters('zoom=0')
+        self.assertEqual(data['type'], 'FeatureCollection')
+        counts = sorted(f['properties']['count'] for f in data['features'])
+        self.assertEqual(counts, [1, 2])
+
+    def test_single_facility_cluster_includes_oar_id(self):
+        data = self.get_clusters('zoom=0&countries=FR')
+        self.assertEqual(len(data['features']), 1)
+        self.assertEqual(data['features'][0]['properties'],
+                         {'count': 1, 'oar_id': self.facility_two.id})
+
+    def test_bbox_limits_clusters(self):
+        data = self.get_clusters('zoom=0&bbox=-80,35,-70,45')
+        self.assertEqual(len(data['features']), 1)
+        self.assertEqual(data['features'][0]['properties']['count'], 2)
+
+    def test_zoom_is_required(self):
+        response = self.client.get('/api/facilities/clusters/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_bbox(self):
+        response = self.client.get(
+            '/api/facilities/clusters/?zoom=0&bbox=1,2,3')
+        self.assertEqual(response.status_code, 400)
+
+
+class FacilitySpatialFilterTest(FacilityAPITestCase):
+    def test_bbox_filter(self):
+        self.assertEqual(self.get_facility_ids('bbox=0,45,5,50'),
+                         [self.facility_two.id])
+
+    def test_bbox_combines_with_other_filters(self):
+        self.assertEqual(self.get_facility_ids('bbox=0,45,5,50&countries=US'),
+                         [])
+
+    def test_radius_filter(self):
+        # The facility is roughly 1.4km from this point
+        self.assertEqual(
+            self.get_facility_ids('lat=39.96&lng=-75.15&radius=2000'),
+            [self.facility_one.id])
+        self.assertEqual(
+            self.get_facility_ids('lat=39.96&lng=-75.15&radius=1000'),
+            [])
+
+    def test_radius_requires_lat_and_lng(self):
+        response = self.client.get('/api/facilities/?radius=1000')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_bbox(self):
+        response = self.client.get('/api/facilities/?bbox=west')
+        self.assertEqual(response.status_code, 400)
+
+
+class FacilityContributorFilterTest(FacilityAPITestCase):
+    def test_filter_by_contributor(self):
+        self.assertEqual(
+            self.get_facility_ids('contributors={}'.format(self.org_two.id)),
+            [self.facility_two.id])
+
+    def test_filter_by_contributor_type(self):
+        self.assertEqual(
+            self.get_facility_ids('contributor_types=Auditor'),
+            [self.facility_one.id])
+
+    def test_rejected_matches_are_excluded(self):
+        self.match_two.status = FacilityMatch.REJECTED
+        self.match_two.save()
+        self.assertEqual(
+            self.get_facility_ids('contributors={}'.format(self.org_two.id)),
+            [])
+
+    def test_contributor_filters_run_as_a_single_query(self):
+        with self.assertNumQueries(1):
+            list(Facility.objects.filter_by_query_params(
+                QueryDict('contributors={}&contributor_types=Auditor'
+                          .format(self.org_one.id))))
+
+
+class FacilityStreamingTest(FacilityAPITestCase):
+    def get_streamed_content(self, query_string):
+        response = self.client.get('/api/facilities/?{}'.format(query_string))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_geojson_stream(self):
+        response, content = self.get_streamed_content('format=geojson-stream')
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        data = json.loads(content)
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual(
+            sorted(f['id'] for f in data['features']),
+            sorted([self.facility_one.id, self.facility_two.id]))
+        self.assertIn('contributors', data['features'][0]['properties'])
+
+    def test_ndjson_stream(self):
+        response, content = self.get_streamed_content('format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        features = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(features), 2)
+        self.assertEqual(features[0]['type'], 'Feature')
+
+    def test_stream_applies_filters(self):
+        _, content = self.get_streamed_content('format=ndjson&countries=FR')
+        features = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([f['id'] for f in features], [self.facility_two.id])
+
+    def test_empty_geojson_stream(self):
+        _, content = self.get_streamed_content(
+            'format=geojson-stream&countries=CN')
+        self.assertEqual(json.loads(content)['features'], [])
+
+    def test_only_list_can_be_streamed(self):
+        response = self.client.get('/api/facilities/{}/?format=ndjson'
+                                   .format(self.facility_one.id))
+        self.assertEqual(response.status_code, 404)
+
+
+@mock.patch('api.signals.transaction.on_commit', lambda f: f())
+class FacilitiesResponseCacheTest(FacilityAPITestCase):
+    def test_repeated_request_is_served_from_cache(self):
+        response = self.client.get('/api/facilities/?countries=US&name=shirt')
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(
+                '/api/facilities/?name=shirt&countries=US')
+
+        self.assertEqual(cached_response.status_code, 200)
+        self.assertEqual(cached_response.content, response.content)
+
+    def test_detail_request_is_served_from_cache(self):
+        url = '/api/facilities/{}/'.format(self.facility_one.id)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(json.loads(response.content)['id'],
+                         self.facility_one.id)
+
+    def test_gzip_response(self):
+        response = self.client.get('/api/facilities/')
+        compressed_response = self.client.get('/api/facilities/',
+                                              HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed_response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed_response.content),
+                         response.content)
+
+    def test_saving_facility_invalidates_cache(self):
+        self.client.get('/api/facilities/')
+        self.facility_one.name = 'Renamed Factory'
+        self.facility_one.save()
+        response = self.client.get('/api/facilities/')
+        names = [f['properties']['name']
+                 for f in json.loads(response.content)['features']]
+        self.assertIn('Renamed Factory', names)
+
+    def test_list_visibility_change_invalidates_cache(self):
+        version = get_facilities_cache_version()
+        self.list_two.is_public = False
+        self.list_two.save()
+        self.assertNotEqual(version, get_facilities_cache_version())
+
+    def test_other_list_changes_do_not_invalidate_cache(self):
+        version = get_facilities_cache_version()
+        self.list_two.description = 'A new description'
+        self.list_two.save()
+        self.assertEqual(version, get_facilities_cache_version())
+
+    def test_error_responses_are_not_cached(self):
+        response = self.client.get('/api/facilities/?bbox=west')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/facilities/?bbox=west')
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch('api.signals.transaction.on_commit', lambda f: f())
+class ConditionalGetTest(FacilityAPITestCase):
+    def setUp(self):
+        super(ConditionalGetTest, self).setUp()
+        self.detail_url = '/api/facilities/{}/'.format(self.facility_one.id)
+
+    def test_detail_not_modified_with_etag(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.detail_url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_not_modified_since(self):
+        response = self.client.get(self.detail_url)
+        response = self.client.get(
+            self.detail_url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_when_list_changes(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.list_one.is_public = False
+        self.list_one.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_of_missing_facility(self):
+        response = self.client.get('/api/facilities/missing/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_not_modified(self):
+        etag = self.client.get('/api/facilities/?countries=US')['ETag']
+        response = self.client.get('/api/facilities/?countries=US',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/api/facilities/?countries=FR',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_etag_changes_when_facility_changes(self):
+        etag = self.client.get('/api/facilities/')['ETag']
+        self.facility_two.name = 'Renamed Factory'
+        self.facility_two.save()
+        response = self.client.get('/api/facilities/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified_response_does_not_query(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url,
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_contributors_not_modified(self):
+        response = self.client.get('/api/contributors/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/contributors/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.org_one.name = 'Renamed organization'
+        self.org_one.save()
+        response = self.client.get('/api/contributors/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class FacilityBulkLookupTest(FacilityAPITestCase):
+    def post_ids(self, ids):
+        return self.client.post('/api/facilities/bulk/', {'ids': ids},
+                                format='json')
+
+    def test_returns_requested_facilities_and_missing_ids(self):
+        response = self.post_ids(
+            [self.facility_two.id, 'missing', self.facility_one.id])
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual([f['id'] for f in data['features']],
+                         [self.facility_two.id, self.facility_one.id])
+        self.assertEqual(data['missing'], ['missing'])
+        self.assertIn('contributors', data['features'][0]['properties'])
+
+    def test_uses_constant_number_of_queries(self):
+        with self.assertNumQueries(1):
+            self.post_ids([self.facility_one.id, self.facility_two.id])
+
+    def test_ids_must_be_a_list(self):
+        response = self.post_ids(self.facility_one.id)
+        self.assertEqual(response.status_code, 400)
+
+    def test_body_must_be_an_object(self):
+        for body in ([self.facility_one.id], self.facility_one.id):
+            response = self.client.post('/api/facilities/bulk/', body,
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.content),
+                             ['"ids" must be a list of OAR IDs.'])
+
+    def test_limits_number_of_ids(self):
+        ids = [str(i) for i in range(settings.MAX_BULK_FACILITY_IDS + 1)]
+        response = self.post_ids(ids)
+        self.assertEqual(response.status_code, 400)
+
+
+class FacilitySparseFieldsetTest(FacilityAPITestCase):
+    def get_features(self, query_string):
+        response = self.client.get('/api/facilities/?{}'.format(query_string))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['features']
+
+    def test_fields_limits_properties(self):
+        features = self.get_features('fields=name')
+        self.assertEqual(len(features), 2)
+        self.assertEqual(list(features[0]['properties'].keys()), ['name'])
+        self.assertIsNotNone(features[0]['id'])
+        self.assertIsNotNone(features[0]['geometry'])
+
+    def test_omit_removes_properties(self):
+        features = self.get_features('omit=contributors,other_names')
+        properties = features[0]['properties']
+        self.assertNotIn('contributors', properties)
+        self.assertNotIn('other_names', properties)
+        self.assertIn('other_addresses', properties)
+
+    def test_fields_use_constant_number_of_queries(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/facilities/?fields=name,address')
+
+    def test_detail_fields(self):
+        response = self.client.get('/api/facilities/{}/?fields=oar_id'.format(
+            self.facility_one.id))
+        self.assertEqual(json.loads(response.content)['properties'],
+                         {'oar_id': self.facility_one.id})
+
+    def test_streamed_fields(self):
+        response = self.client.get(
+            '/api/facilities/?format=ndjson&fields=name')
+        content = b''.join(response.streaming_content).decode()
+        features = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(list(features[0]['properties'].keys()), ['name'])
+
+    def test_invalid_field_name(self):
+        response = self.client.get('/api/facilities/?fields=name,secret')
+        self.assertEqual(response.status_code, 400)
+
+
+class FacilityFullTextSearchTest(FacilityAPITestCase):
+    def setUp(self):
+        super(FacilityFullTextSearchTest, self).setUp()
+
+        self.alias_item = FacilityListItem \
+            .objects \
+            .create(name='Shirt Denim Mill',
+                    address='5 Harbor Rd',
+                    country_code='FR',
+                    facility_list=self.list_one,
+                    row_index=2,
+                    geocoded_point=Point(2.33, 48.87),
+                    status=FacilityListItem.MATCHED)
+
+        self.alias_match = FacilityMatch \
+            .objects \
+            .create(status=FacilityMatch.CONFIRMED,
+                    facility=self.facility_two,
+                    results='',
+                    facility_list_item=self.alias_item)
+
+    def search(self, q):
+        response = self.client.get('/api/facilities/?q={}'.format(q))
+        self.assertEqual(response.status_code, 200)
+        return [f['id'] for f in json.loads(response.content)['features']]
+
+    def test_matches_facility_name(self):
+        self.assertEqual(self.search('pants'), [self.facility_two.id])
+
+    def test_matches_alias_name(self):
+        self.assertEqual(self.search('denim'), [self.facility_two.id])
+
+    def test_matches_alias_address(self):
+        self.assertEqual(self.search('harbor'), [self.facility_two.id])
+
+    def test_name_outranks_alias(self):
+        self.assertEqual(self.search('shirt'),
+                         [self.facility_one.id, self.facility_two.id])
+
+    def test_excludes_non_public_lists(self):
+        self.list_one.is_public = False
+        self.list_one.save()
+        self.assertEqual(self.search('denim'), [])
+
+
+class FacilityFacetsTest(FacilityAPITestCase):
+    def get_facets(self, query_string=''):
+        response = self.client.get(
+            '/api/facilities/facets/?{}'.format(query_string))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_unfiltered_facets(self):
+        facets = self.get_facets()
+        self.assertEqual(sorted(facets['countries']),
+                         [['FR', 'France', 1],
+                          ['US', 'United States', 1]])
+        self.assertEqual(sorted(facets['contributors']),
+                         sorted([[self.org_one.id, self.org_one.name, 1],
+                                 [self.org_two.id, self.org_two.name, 1]]))
+        self.assertEqual(sorted(facets['contributor_types']),
+                         [['Auditor', 'Auditor', 1],
+                          ['Brand/Retailer', 'Brand/Retailer', 1]])
+
+    def test_facets_respect_filters(self):
+        facets = self.get_facets('countries=US')
+        self.assertEqual(facets['countries'], [['US', 'United States', 1]])
+        self.assertEqual(facets['contributors'],
+                         [[self.org_one.id, self.org_one.name, 1]])
+        self.assertEqual(facets['contributor_types'],
+                         [['Auditor', 'Auditor', 1]])
+
+    def test_contributor_counts_facilities_once(self):
+        item = FacilityListItem \
+            .objects \
+            .create(name='Shirt Factory',
+                    address='1234 Main St',
+                    country_code='US',
+                    facility_list=self.list_one,
+                    row_index=2,
+                    geocoded_point=Point(-75.16, 39.95),
+                    status=FacilityListItem.MATCHED)
+        FacilityMatch \
+            .objects \
+            .create(status=FacilityMatch.CONFIRMED,
+                    facility=self.facility_one,
+                    results='',
+                    facility_list_item=item)
+
+        facets = self.get_facets('countries=US')
+        self.assertEqual(facets['contributors'],
+                         [[self.org_one.id, self.org_one.name, 1]])
+
+    def test_facets_respect_radius_filter(self):
+        facets = self.get_facets('lat=39.96&lng=-75.15&radius=2000')
+        self.assertEqual(facets['countries'], [['US', 'United States', 1]])
+        self.assertEqual(facets['contributors'],
+                         [[self.org_one.id, self.org_one.name, 1]])
+
+    def test_one_query_per_facet(self):
+        with self.assertNumQueries(3):
+            self.client.get('/api/facilities/facets/')
+
+
+class FacilityNearestTest(FacilityAPITestCase):
+    def get_nearest(self, query_string):
+        response = self.client.get(
+            '/api/facilities/nearest/?{}'.format(query_string))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['features']
+
+    def test_ordered_by_distance(self):
+        features = self.get_nearest('lat=40.0&lng=-75.0')
+        self.assertEqual([f['id'] for f in features],
+                         [self.facility_one.id, self.facility_two.id])
+        self.assertLess(features[0]['properties']['distance'],
+                        features[1]['properties']['distance'])
+
+    def test_k_limits_results(self):
+        features = self.get_nearest('lat=48.0&lng=2.0&k=1')
+        self.assertEqual([f['id'] for f in features], [self.facility_two.id])
+
+    def test_countries_restrict_results(self):
+        features = self.get_nearest('lat=48.0&lng=2.0&countries=US')
+        self.assertEqual([f['id'] for f in features], [self.facility_one.id])
+
+    def test_invalid_k(self):
+        response = self.client.get(
+            '/api/facilities/nearest/?lat=48.0&lng=2.0&k=0')
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_point(self):
+        response = self.client.get('/api/facilities/nearest/?lat=48.0')
+        self.assertEqual(response.status_code, 400)
+
+    def test_nearest_can_be_used_as_subquery(self):
+        nearest_ids = Facility \
+            .objects \
+            .order_by_distance(48.0, 2.0) \
+            .values('id')[:1]
+        self.assertEqual(
+            list(Facility
+                 .objects
+                 .filter(id__in=nearest_ids)
+                 .values_list('id', flat=True)),
+            [self.facility_two.id])
+
+
+class FacilitySummaryTest(FacilityAPITestCase):
+    def test_new_match_updates_summary(self):
+        alias_item = FacilityListItem \
+            .objects \
+            .create(name='Shirt Factory Inc',
+                    address='1234 Main Street',
+                    country_code='US',
+                    facility_list=self.list_two,
+                    row_index=2,
+                    geocoded_point=Point(-75.16, 39.95),
+                    status=FacilityListItem.MATCHED)
+        FacilityMatch \
+            .objects \
+            .create(status=FacilityMatch.CONFIRMED,
+                    facility=self.facility_one,
+                    results='',
+                    facility_list_item=alias_item)
+
+        self.facility_one.refresh_from_db()
+        self.assertEqual(self.facility_one.contributor_ids,
+                         sorted([self.org_one.id, self.org_two.id]))
+        self.assertEqual(self.facility_one.contributor_types,
+                         ['Auditor', 'Brand/Retailer'])
+        self.assertEqual(self.facility_one.alias_names,
+                         ['Shirt Factory Inc'])
+        self.assertEqual(self.facility_one.alias_addresses,
+                         ['1234 Main Street'])
+
+    def test_rejected_match_is_removed_from_summary(self):
+        self.match_one.status = FacilityMatch.REJECTED
+        self.match_one.save()
+
+        self.facility_one.refresh_from_db()
+        self.assertEqual(self.facility_one.contributor_ids, [])
+        self.assertEqual(self.facility_one.contributor_names, [])
+
+    def test_list_visibility_updates_summary(self):
+        self.list_one.is_public = False
+        self.list_one.save()
+
+        self.facility_one.refresh_from_db()
+        self.assertEqual(self.facility_one.contributor_names, [])
+        # Private lists still count towards the contributor filters
+        self.assertEqual(self.facility_one.contributor_ids, [self.org_one.id])
+
+    def test_organization_rename_updates_summary(self):
+        self.org_one.name = 'renamed organization'
+        self.org_one.save()
+
+        self.facility_one.refresh_from_db()
+        self.assertEqual(self.facility_one.contributor_names,
+                         ['renamed organization (one)'])
+
+    def test_list_rename_updates_summary(self):
+        self.list_one.name = 'renamed list'
+        self.list_one.save()
+
+        self.facility_one.refresh_from_db()
+        self.assertEqual(self.facility_one.contributor_names,
+                         ['organization one (renamed list)'])
+
+    def test_rebuild_command(self):
+        Facility.objects.update(contributor_ids=[], contributor_names=[])
+
+        call_command('rebuildfacilitysummaries', stdout=mock.Mock())
+
+        self.facility_one.refresh_from_db()
+        self.assertEqual(self.facility_one.contributor_ids, [self.org_one.id])
+        self.assertEqual(self.facility_one.contributor_names,
+                         ['organization one (one)'])
+
+    def test_detail_is_a_single_row_fetch(self):
+        url = '/api/facilities/{}/'.format(self.facility_one.id)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+
+class FacilityListReplacementTest(FacilityAPITestCase):
+    def setUp(self):
+        super(FacilityListReplacementTest, self).setUp()
+        self.new_list = FacilityList \
+            .objects \
+            .create(header='country,name,address',
+                    file_name='one',
+                    name='one updated',
+                    organization=self.org_one,
+                    replaces=self.list_one)
+
+    def create_item(self, row):
+        create_facility_list_items(self.new_list, [row.encode()])
+        return self.new_list.facilitylistitem_set.get()
+
+    def test_unchanged_row_reuses_results(self):
+        item = self.create_item('US, shirt  factory,1234 MAIN ST')
+        self.assertEqual(item.status, FacilityListItem.MATCHED)
+        self.assertEqual(item.geocoded_point,
+                         self.list_item_one.geocoded_point)
+        self.assertEqual(item.name, ' shirt  factory')
+
+        match = item.facilitymatch_set.get()
+        self.assertEqual(match.facility, self.facility_one)
+        self.assertEqual(match.status, FacilityMatch.AUTOMATIC)
+
+    def test_changed_row_is_left_for_processing(self):
+        item = self.create_item('US,Shirt Factory,1300 Main St')
+        self.assertEqual(item.status, FacilityListItem.PARSED)
+        self.assertIsNone(item.geocoded_point)
+        self.assertEqual(item.facilitymatch_set.count(), 0)
+
+    def test_reused_matches_update_facility_summary(self):
+        self.create_item('US,Shirt Factory,1234 Main St')
+        self.facility_one.refresh_from_db()
+        self.assertIn('organization one (one updated)',
+                      self.facility_one.contributor_names)
+
+    def test_reusable_items_are_looked_up_per_batch(self):
+        rows = [b'US,Shirt Factory,1234 Main St', b'US,Pants Factory,1 Elm St']
+        with mock.patch('api.processing.get_reusable_items',
+                        wraps=get_reusable_items) as lookup:
+            create_facility_list_items(self.new_list, rows, batch_size=1)
+
+        self.assertEqual(lookup.call_count, 2)
+        (replaces_id, first_batch), _ = lookup.call_args_list[0]
+        self.assertEqual(replaces_id, self.list_one.id)
+        self.assertEqual([item.name for item in first_batch],
+                         ['Shirt Factory'])
+        statuses = self.new_list \
+            .facilitylistitem_set \
+            .order_by('row_index') \
+            .values_list('status', flat=True)
+        self.assertEqual(list(statuses), [FacilityListItem.MATCHED,
+                                          FacilityListItem.PARSED])
+
+
+class ClosingConnectionTest(TestCase):
+    @mock.patch('api.threads.connection')
+    def test_connection_is_closed_when_thread_fails(self, thread_connection):
+        with self.assertRaises(ValueError):
+            with closing_connection():
+                raise ValueError('Thread failed')
+        thread_connection.close.assert_called_once_with()
@@ -0,0 +1,17 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def closing_connection():
+    """
+    Close the database connection of the current thread on exit. Django
+    closes connections when a request finishes, but threads started by the
+    application get their own connection, which is left open unless the
+    thread closes it.
+    """
+    try:
+        yield
+    finally:
+        connection.close()
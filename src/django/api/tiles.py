@@ -0,0 +1,101 @@
+import math
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+
+# Half the width of the world in EPSG:3857 (Web Mercator) meters
+WEB_MERCATOR_HALF_WIDTH = 20037508.342789244
+
+MVT_LAYER_NAME = 'facilities'
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+FACILITY_TILE_SQL = """
+SELECT ST_AsMVT(tile, %s, %s, 'geom')
+FROM (
+    SELECT
+        api_facility.id,
+        api_facility.name,
+        api_facility.address,
+        api_facility.country_code,
+        ST_AsMVTGeom(
+            ST_Transform(api_facility.location, 3857),
+            ST_MakeEnvelope(%s, %s, %s, %s, 3857),
+            %s,
+            %s,
+            true
+        ) AS geom
+    FROM api_facility
+    WHERE api_facility.id IN ({facility_ids_sql})
+) AS tile
+"""
+
+
+def is_valid_tile(z, x, y):
+    if z < 0 or z > settings.MAX_VECTOR_TILE_ZOOM:
+        return False
+    tiles_per_side = 2 ** z
+    return 0 <= x < tiles_per_side and 0 <= y < tiles_per_side
+
+
+def get_tile_mercator_bounds(z, x, y):
+    """
+    Return the (xmin, ymin, xmax, ymax) bounds of the XYZ tile in Web
+    Mercator meters.
+    """
+    tile_size = 2 * WEB_MERCATOR_HALF_WIDTH / (2 ** z)
+    xmin = -WEB_MERCATOR_HALF_WIDTH + x * tile_size
+    ymax = WEB_MERCATOR_HALF_WIDTH - y * tile_size
+    return (xmin, ymax - tile_size, xmin + tile_size, ymax)
+
+
+def mercator_to_lng_lat(mx, my):
+    lng = mx / WEB_MERCATOR_HALF_WIDTH * 180.0
+    lat = math.degrees(
+        math.atan(math.sinh(math.pi * my / WEB_MERCATOR_HALF_WIDTH)))
+    return (lng, lat)
+
+
+def get_tile_polygon(z, x, y):
+    """
+    Return the XYZ tile bounds as a WGS84 polygon that can be compared
+    directly against the spatially indexed `Facility.location` column.
+    """
+    xmin, ymin, xmax, ymax = get_tile_mercator_bounds(z, x, y)
+    west, south = mercator_to_lng_lat(xmin, ymin)
+    east, north = mercator_to_lng_lat(xmax, ymax)
+    polygon = Polygon.from_bbox((west, south, east, north))
+    polygon.srid = 4326
+    return polygon
+
+
+def get_facility_vector_tile(queryset, z, x, y):
+    """
+    Render the facilities in `queryset` that fall within the XYZ tile as a
+    Mapbox Vector Tile. The tile is built in the database with ST_AsMVT and
+    the number of features is capped by `MAX_FACILITIES_PER_VECTOR_TILE` so
+    the tile size does not grow with the size of the registry.
+    """
+    facility_ids = queryset \
+        .filter(location__bboverlaps=get_tile_polygon(z, x, y)) \
+        .order_by('id') \
+        .values('id')[:settings.MAX_FACILITIES_PER_VECTOR_TILE]
+
+    facility_ids_sql, facility_ids_params = \
+        facility_ids.query.sql_with_params()
+
+    sql = FACILITY_TILE_SQL.format(facility_ids_sql=facility_ids_sql)
+    params = [MVT_LAYER_NAME, MVT_EXTENT,
+              *get_tile_mercator_bounds(z, x, y),
+              MVT_EXTENT, MVT_BUFFER,
+              *facility_ids_params]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    if row is None or row[0] is None:
+        return b''
+
+    return bytes(row[0])
@@ -0,0 +1,92 @@
+import gzip
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.core.files import File
+
+GZIP_MAGIC_NUMBER = b'\x1f\x8b'
+ZIP_MAGIC_NUMBER = b'PK\x03\x04'
+
+
+class InvalidUploadError(ValueError):
+    pass
+
+
+def get_size_limit_message():
+    return 'Uploaded file exceeds the maximum size of {:.1f}MB.'.format(
+        settings.MAX_UPLOADED_FILE_SIZE_IN_BYTES / (1024*1024))
+
+
+class SizeLimitedReader:
+    """
+    Wrap a binary stream and raise `InvalidUploadError` as soon as more than
+    `max_size` bytes have been read from it. Because the limit is checked as
+    the data is read, a small compressed file that expands to a very large
+    one is rejected without being decompressed in full.
+    """
+    def __init__(self, stream, max_size):
+        self.stream = stream
+        self.max_size = max_size
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        try:
+            data = self.stream.read(size)
+        except (OSError, EOFError, zlib.error, zipfile.BadZipFile):
+            raise InvalidUploadError(
+                'The uploaded file could not be decompressed.')
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_size:
+            raise InvalidUploadError(get_size_limit_message())
+        return data
+
+
+def open_zip_member(uploaded_file):
+    try:
+        archive = zipfile.ZipFile(uploaded_file)
+    except zipfile.BadZipFile:
+        raise InvalidUploadError('The uploaded zip file could not be read.')
+
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    if len(members) != 1:
+        raise InvalidUploadError(
+            'Uploaded zip files must contain exactly one file.')
+
+    # The declared size can be forged, so the size of the decompressed data
+    # is also checked as it is read
+    if members[0].file_size > settings.MAX_UPLOADED_FILE_SIZE_IN_BYTES:
+        raise InvalidUploadError(get_size_limit_message())
+
+    return archive.open(members[0])
+
+
+def open_decompressed(uploaded_file):
+    """
+    Return a binary stream of the content of `uploaded_file`, which may be a
+    plain CSV file, a gzip-compressed file, or a zip archive containing a
+    single file. The compression is detected from the leading bytes of the
+    file rather than its name.
+    """
+    uploaded_file.seek(0)
+    magic_number = uploaded_file.read(len(ZIP_MAGIC_NUMBER))
+    uploaded_file.seek(0)
+
+    if magic_number.startswith(GZIP_MAGIC_NUMBER):
+        return gzip.GzipFile(fileobj=uploaded_file, mode='rb')
+    if magic_number == ZIP_MAGIC_NUMBER:
+        return open_zip_member(uploaded_file)
+    return uploaded_file
+
+
+def iter_uploaded_lines(uploaded_file):
+    """
+    Yield the lines of `uploaded_file`, including the header, as bytes. The
+    content is decompressed as it is read and `InvalidUploadError` is raised
+    if it exceeds `MAX_UPLOADED_FILE_SIZE_IN_BYTES`.
+    """
+    stream = SizeLimitedReader(open_decompressed(uploaded_file),
+                               settings.MAX_UPLOADED_FILE_SIZE_IN_BYTES)
+    # `File` splits the chunks into lines with the same handling of line
+    # endings as iterating over an uploaded file directly
+    yield from File(stream)
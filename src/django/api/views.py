@@ -1,8 +1,14 @@
 import os
 
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from collections import OrderedDict
+from itertools import chain
+
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
 from django.db import transaction
 from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
 from django.contrib.auth import (authenticate, login, logout)
 from rest_framework import viewsets, status
 from rest_framework.authtoken.views import ObtainAuthToken
@@ -16,11 +22,25 @@ from rest_framework.decorators import (api_view,
                                        action)
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_auth.views import LoginView, LogoutView
 
-from oar.settings import MAX_UPLOADED_FILE_SIZE_IN_BYTES, ENVIRONMENT
-
+from oar.settings import (MAX_UPLOADED_FILE_SIZE_IN_BYTES,
+                          MAX_VECTOR_TILE_ZOOM,
+                          MAX_BULK_FACILITY_IDS,
+                          DEFAULT_NEAREST_FACILITIES,
+                          MAX_NEAREST_FACILITIES)
+
+from api.cache import cache_facilities_response
+from api.conditional import (condition_from_validators,
+                             get_contributors_validators,
+                             get_facilities_validators)
+from api.clustering import get_facility_clusters
+from api.facets import get_facility_facets
+from api.ingestion import (deactivate_replaced_list,
+                           enqueue_facility_list_ingestion,
+                           submit_processing_jobs)
 from api.constants import CsvHeaderField, FacilitiesQueryParams
 from api.models import (FacilityList,
                         FacilityListItem,
@@ -28,13 +48,20 @@ from api.models import (FacilityList,
                         FacilityMatch,
                         Organization,
                         User)
-from api.processing import parse_csv_line
-from api.serializers import (FacilityListSerializer,
+from api.processing import create_facility_list_items, parse_csv_line
+from api.pagination import FacilitiesCursorPagination
+from api.streaming import (STREAMING_RENDERERS,
+                           make_streaming_facilities_response)
+from api.serializers import (FacilityListIngestionSerializer,
+                             FacilityListSerializer,
                              FacilityListItemSerializer,
                              FacilitySerializer,
                              UserSerializer)
 from api.countries import COUNTRY_CHOICES
-from api.aws_batch import submit_jobs
+from api.tiles import get_facility_vector_tile, is_valid_tile
+from api.uploads import (InvalidUploadError,
+                         get_size_limit_message,
+                         iter_uploaded_lines)
 
 
 @permission_classes((AllowAny,))
@@ -170,6 +197,7 @@ def token_auth_example(request):
     return Response({'name': name})
 
 
+@condition_from_validators(get_contributors_validators)
 @api_view(['GET'])
 @permission_classes((AllowAny,))
 def all_contributors(request):
@@ -193,70 +221,229 @@ def all_countries(request):
     return Response(COUNTRY_CHOICES)
 
 
+@api_view(['GET'])
+@permission_classes((AllowAny,))
+def facility_vector_tile(request, z, x, y):
+    z, x, y = int(z), int(x), int(y)
+    if not is_valid_tile(z, x, y):
+        raise NotFound()
+
+    queryset = Facility \
+        .objects \
+        .filter_by_query_params(request.query_params)
+
+    tile = get_facility_vector_tile(queryset, z, x, y)
+
+    return HttpResponse(tile,
+                        content_type='application/vnd.mapbox-vector-tile')
+
+
 class FacilitiesViewSet(ReadOnlyModelViewSet):
     queryset = Facility.objects.all()
     serializer_class = FacilitySerializer
     permission_classes = (AllowAny,)
+    pagination_class = FacilitiesCursorPagination
+
+    def get_renderers(self):
+        renderers = super(FacilitiesViewSet, self).get_renderers()
+
+        # Only the list can be streamed
+        if self.action == 'list':
+            renderers += [renderer() for renderer in STREAMING_RENDERERS]
+
+        return renderers
 
+    def get_serializer_fields(self, request):
+        """
+        Return the `FacilitySerializer` fields selected with the `fields` and
+        `omit` query parameters, or None if all fields should be serialized.
+        """
+        fields = request.query_params.get(FacilitiesQueryParams.FIELDS, None)
+        omit = request.query_params.get(FacilitiesQueryParams.OMIT, None)
+
+        if fields is None and omit is None:
+            return None
+
+        def parse_field_names(value):
+            field_names = {name.strip() for name in value.split(',')
+                           if name.strip() != ''}
+            invalid_names = field_names - set(FacilitySerializer.Meta.fields)
+            if len(invalid_names) > 0:
+                raise ValidationError(
+                    'Invalid field names: {}. Must be one of {}.'.format(
+                        ', '.join(sorted(invalid_names)),
+                        ', '.join(FacilitySerializer.Meta.fields)))
+            return field_names
+
+        selected_fields = set(FacilitySerializer.Meta.fields)
+        if fields is not None:
+            selected_fields = parse_field_names(fields)
+        if omit is not None:
+            selected_fields -= parse_field_names(omit)
+
+        return selected_fields
+
+    def limit_queryset_to_fields(self, queryset, fields):
+        """
+        Load only the columns needed to serialize `fields`, where None means
+        all fields.
+        """
+        if fields is None:
+            return queryset.defer('search_vector',
+                                  'contributor_ids',
+                                  'contributor_types')
+
+        # `created_at` is loaded because it is read by the cursor pagination
+        model_field_names = {f.name for f in Facility._meta.concrete_fields}
+        summary_columns = {
+            column
+            for field, column
+            in FacilitySerializer.SUMMARY_FIELD_COLUMNS.items()
+            if field in fields
+        }
+        columns = (set(fields) | set(FacilitySerializer.REQUIRED_FIELDS)
+                   | summary_columns | {'created_at'}) & model_field_names
+
+        return queryset.only(*columns)
+
+    @method_decorator(condition_from_validators(get_facilities_validators))
+    @cache_facilities_response
     def list(self, request):
-        name = request.query_params.get(FacilitiesQueryParams.NAME,
-                                        None)
-        contributors = request.query_params \
-                              .getlist(FacilitiesQueryParams.CONTRIBUTORS)
-        contributor_types = request \
-            .query_params \
-            .getlist(FacilitiesQueryParams.CONTRIBUTOR_TYPES)
-        countries = request.query_params \
-                           .getlist(FacilitiesQueryParams.COUNTRIES)
+        fields = self.get_serializer_fields(request)
+        queryset = Facility \
+            .objects \
+            .filter_by_query_params(request.query_params)
 
-        queryset = Facility.objects.all()
+        queryset = self.limit_queryset_to_fields(queryset, fields)
 
-        if name is not None:
-            queryset = queryset.filter(name__icontains=name)
+        if isinstance(request.accepted_renderer, STREAMING_RENDERERS):
+            return make_streaming_facilities_response(
+                queryset, request.accepted_renderer, fields)
 
-        if countries is not None and len(countries):
-            queryset = queryset.filter(country_code__in=countries)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response_data = FacilitySerializer(
+                page, many=True, fields=fields).data
+            return self.get_paginated_response(response_data)
 
-        if len(contributor_types):
-            type_match_facility_ids = [
-                match['facility__id']
-                for match
-                in FacilityMatch
-                .objects
-                .filter(status__in=[FacilityMatch.AUTOMATIC,
-                                    FacilityMatch.CONFIRMED])
-                .filter(facility_list_item__facility_list__organization__org_type__in=contributor_types) # NOQA
-                .values('facility__id')
-            ]
-
-            queryset = queryset.filter(id__in=type_match_facility_ids)
-
-        if len(contributors):
-            name_match_facility_ids = [
-                match['facility__id']
-                for match
-                in FacilityMatch
-                .objects
-                .filter(status__in=[FacilityMatch.AUTOMATIC,
-                                    FacilityMatch.CONFIRMED])
-                .filter(facility_list_item__facility_list__organization__id__in=contributors) # NOQA
-                .values('facility__id')
-            ]
-
-            queryset = queryset.filter(id__in=name_match_facility_ids)
-
-        response_data = FacilitySerializer(queryset, many=True).data
+        response_data = FacilitySerializer(
+            queryset, many=True, fields=fields).data
 
         return Response(response_data)
 
+    @method_decorator(condition_from_validators(get_facilities_validators))
+    @cache_facilities_response
     def retrieve(self, request, pk=None):
         try:
-            queryset = Facility.objects.get(pk=pk)
-            response_data = FacilitySerializer(queryset).data
+            fields = self.get_serializer_fields(request)
+            queryset = self \
+                .limit_queryset_to_fields(Facility.objects.all(), fields) \
+                .get(pk=pk)
+            response_data = FacilitySerializer(queryset, fields=fields).data
             return Response(response_data)
         except Facility.DoesNotExist:
             raise NotFound()
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        oar_ids = None
+        if isinstance(request.data, dict):
+            oar_ids = request.data.get('ids', None)
+
+        if not isinstance(oar_ids, list) \
+           or not all(isinstance(oar_id, str) for oar_id in oar_ids):
+            raise ValidationError('"ids" must be a list of OAR IDs.')
+
+        if len(oar_ids) > MAX_BULK_FACILITY_IDS:
+            raise ValidationError(
+                'No more than {} OAR IDs can be requested at once.'.format(
+                    MAX_BULK_FACILITY_IDS))
+
+        # Remove duplicates while preserving the requested order
+        oar_ids = list(OrderedDict.fromkeys(oar_ids))
+
+        fields = self.get_serializer_fields(request)
+        facilities = self.limit_queryset_to_fields(
+            Facility.objects.filter(id__in=oar_ids), fields)
+        facilities_by_id = {facility.id: facility for facility in facilities}
+
+        response_data = FacilitySerializer(
+            [facilities_by_id[oar_id]
+             for oar_id in oar_ids
+             if oar_id in facilities_by_id],
+            many=True,
+            fields=fields).data
+        response_data['missing'] = [
+            oar_id
+            for oar_id in oar_ids
+            if oar_id not in facilities_by_id
+        ]
+
+        return Response(response_data)
+
+    @action(detail=False, methods=['get'], url_path='nearest')
+    def nearest(self, request):
+        try:
+            k = int(request.query_params.get(FacilitiesQueryParams.K,
+                                             DEFAULT_NEAREST_FACILITIES))
+        except ValueError:
+            raise ValidationError('"k" must be an integer.')
+
+        if k < 1 or k > MAX_NEAREST_FACILITIES:
+            raise ValidationError(
+                '"k" must be between 1 and {}.'.format(
+                    MAX_NEAREST_FACILITIES))
+
+        queryset = Facility.objects.all()
+
+        countries = request.query_params.getlist(
+            FacilitiesQueryParams.COUNTRIES)
+        if len(countries):
+            queryset = queryset.filter(country_code__in=countries)
+
+        fields = self.get_serializer_fields(request)
+        facilities = list(
+            self.limit_queryset_to_fields(queryset, fields)
+            .order_by_distance(
+                request.query_params.get(FacilitiesQueryParams.LAT, None),
+                request.query_params.get(FacilitiesQueryParams.LNG, None))
+            [:k])
+
+        response_data = FacilitySerializer(
+            facilities, many=True, fields=fields).data
+        for feature, facility in zip(response_data['features'], facilities):
+            feature['properties']['distance'] = facility.distance
+
+        return Response(response_data)
+
+    @action(detail=False, methods=['get'], url_path='clusters')
+    @cache_facilities_response
+    def clusters(self, request):
+        try:
+            zoom = int(request.query_params[FacilitiesQueryParams.ZOOM])
+        except (KeyError, ValueError):
+            raise ValidationError('"zoom" must be an integer.')
+
+        if zoom < 0 or zoom > MAX_VECTOR_TILE_ZOOM:
+            raise ValidationError(
+                '"zoom" must be between 0 and {}.'.format(
+                    MAX_VECTOR_TILE_ZOOM))
+
+        queryset = Facility \
+            .objects \
+            .filter_by_query_params(request.query_params)
+
+        return Response(get_facility_clusters(queryset, zoom))
+
+    @action(detail=False, methods=['get'], url_path='facets')
+    @cache_facilities_response
+    def facets(self, request):
+        queryset = Facility \
+            .objects \
+            .filter_by_query_params(request.query_params)
+
+        return Response(get_facility_facets(queryset))
+
 
 class FacilityListViewSet(viewsets.ModelViewSet):
     queryset = FacilityList.objects.all()
@@ -280,14 +467,23 @@ class FacilityListViewSet(viewsets.ModelViewSet):
         if 'file' not in request.data:
             raise ValidationError('No file specified.')
         csv_file = request.data['file']
-        if type(csv_file) is not InMemoryUploadedFile:
+        # Files larger than FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to disk.
+        # Both are read one line at a time so that memory use does not
+        # depend on the size of the file.
+        if type(csv_file) not in (InMemoryUploadedFile,
+                                  TemporaryUploadedFile):
             raise ValidationError('File not submitted properly.')
         if csv_file.size > MAX_UPLOADED_FILE_SIZE_IN_BYTES:
-            mb = MAX_UPLOADED_FILE_SIZE_IN_BYTES / (1024*1024)
-            raise ValidationError(
-                'Uploaded file exceeds the maximum size of {:.1f}MB.'.format(
-                    mb))
-        header = csv_file.readline().decode().rstrip()
+            raise ValidationError(get_size_limit_message())
+
+        # Compressed files are decompressed as they are read and the size
+        # limit is also applied to the decompressed content
+        lines = iter_uploaded_lines(csv_file)
+        try:
+            header_line = next(lines, b'')
+        except InvalidUploadError as e:
+            raise ValidationError(str(e))
+        header = header_line.decode().rstrip()
         self._validate_header(header)
 
         try:
@@ -317,11 +513,18 @@ class FacilityListViewSet(viewsets.ModelViewSet):
                 raise ValidationError(
                     '{0} is not a valid FacilityList ID.'.format(replaces))
             replaces = old_list_qs[0]
-            if FacilityList.objects.filter(replaces=replaces).count() > 0:
+            # A replacement whose ingestion failed does not replace the list
+            if FacilityList \
+                    .objects \
+                    .filter(replaces=replaces) \
+                    .exclude(ingestion_status=FacilityList.ERROR) \
+                    .exists():
                 raise ValidationError(
                     'FacilityList {0} has already been replaced.'.format(
                         replaces.pk))
 
+        ingest_async = str(request.data.get('async', '')).lower() == 'true'
+
         new_list = FacilityList(
             organization=organization,
             name=name,
@@ -329,22 +532,30 @@ class FacilityListViewSet(viewsets.ModelViewSet):
             file_name=csv_file.name,
             header=header,
             replaces=replaces)
+        if ingest_async:
+            new_list.ingestion_status = FacilityList.PENDING
+            new_list.file.save(csv_file.name, csv_file, save=False)
         new_list.save()
 
-        if replaces is not None:
-            replaces.is_active = False
-            replaces.save()
-
-        for idx, line in enumerate(csv_file):
-            new_item = FacilityListItem(
-                row_index=idx,
-                facility_list=new_list,
-                raw_data=line.decode().rstrip()
-            )
-            new_item.save()
+        if ingest_async:
+            # The replaced list is deactivated by the ingestion worker once
+            # the items of the new list have been created
+            enqueue_facility_list_ingestion(new_list)
+            status_url = reverse('facility-list-ingestion-status',
+                                 kwargs={'pk': new_list.pk},
+                                 request=request)
+            serializer = self.get_serializer(new_list)
+            return Response(serializer.data,
+                            status=status.HTTP_202_ACCEPTED,
+                            headers={'Location': status_url})
 
-        if ENVIRONMENT in ('Staging', 'Production'):
-            submit_jobs(ENVIRONMENT, new_list)
+        try:
+            # The header line is also stored as the first item
+            create_facility_list_items(new_list, chain([header_line], lines))
+        except InvalidUploadError as e:
+            raise ValidationError(str(e))
+        deactivate_replaced_list(new_list)
+        submit_processing_jobs(new_list)
 
         serializer = self.get_serializer(new_list)
         return Response(serializer.data)
@@ -358,6 +569,18 @@ class FacilityListViewSet(viewsets.ModelViewSet):
         except Organization.DoesNotExist:
             raise ValidationError('User organization cannot be None')
 
+    @action(detail=True, methods=['get'], url_path='status')
+    def ingestion_status(self, request, pk=None):
+        try:
+            facility_list = FacilityList \
+                .objects \
+                .filter(organization=request.user.organization) \
+                .get(pk=pk)
+            return Response(
+                FacilityListIngestionSerializer(facility_list).data)
+        except (Organization.DoesNotExist, FacilityList.DoesNotExist):
+            raise NotFound()
+
     def retrieve(self, request, pk):
         try:
             user_organization = request.user.organization
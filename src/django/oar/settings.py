@@ -80,6 +80,7 @@ INSTALLED_APPS = [
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'django.contrib.sessions',
     'django.contrib.sites',
     'django.contrib.messages',
@@ -165,6 +166,31 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered facility API responses. See api/cache.py
+    'facilities': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'facilities',
+        'TIMEOUT': 60 * 60 * 24,
+    },
+}
+
+if ENVIRONMENT in ('Staging', 'Production'):
+    # Share cached responses between app servers. The table is created by
+    # the `createcachetable` management command.
+    CACHES['facilities'] = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'api_facilities_cache',
+        'TIMEOUT': 60 * 60 * 24,
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -226,7 +252,76 @@ WATCHMAN_CHECKS = (
 )
 
 # Application settings
-MAX_UPLOADED_FILE_SIZE_IN_BYTES = 5242880
+MAX_UPLOADED_FILE_SIZE_IN_BYTES = int(
+    os.getenv('MAX_UPLOADED_FILE_SIZE_IN_BYTES', 524288000))
+
+# Uploaded facility lists are stored here until they have been ingested
+MEDIA_ROOT = os.getenv('DJANGO_MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+if ENVIRONMENT in ('Staging', 'Production'):
+    # Store uploads in S3 so that a list uploaded to one app server can be
+    # ingested by `recoverfacilitylistingestion` on another. The bucket
+    # expires objects that are left behind by a failed ingestion.
+    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+    AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
+    if AWS_STORAGE_BUCKET_NAME is None:
+        raise ImproperlyConfigured(
+            'Invalid AWS_STORAGE_BUCKET_NAME provided, must be set')
+    AWS_DEFAULT_ACL = 'private'
+    AWS_QUERYSTRING_AUTH = True
+    AWS_S3_FILE_OVERWRITE = False
+
+# The dotted path of the class that ingests facility lists uploaded in
+# asynchronous mode. It must have an `enqueue(facility_list_id)` method.
+FACILITY_LIST_INGESTION_WORKER = os.getenv(
+    'FACILITY_LIST_INGESTION_WORKER',
+    'api.ingestion.ThreadIngestionWorker')
+
+# The number of minutes after which a facility list that is still waiting
+# for or undergoing ingestion is resolved by `recoverfacilitylistingestion`
+FACILITY_LIST_INGESTION_TIMEOUT_MINUTES = int(
+    os.getenv('FACILITY_LIST_INGESTION_TIMEOUT_MINUTES', 30))
+
+# The number of uploaded facility list items inserted with each query
+FACILITY_LIST_ITEM_BATCH_SIZE = int(
+    os.getenv('FACILITY_LIST_ITEM_BATCH_SIZE', 1000))
+
+# The maximum number of OAR IDs that can be requested from the bulk facility
+# lookup endpoint at once
+MAX_BULK_FACILITY_IDS = 1000
+
+# The default and maximum number of facilities returned by the nearest
+# facilities endpoint
+DEFAULT_NEAREST_FACILITIES = 10
+MAX_NEAREST_FACILITIES = 100
+
+# Vector tiles
+MAX_VECTOR_TILE_ZOOM = 22
+MAX_FACILITIES_PER_VECTOR_TILE = 10000
+
+# The number of days for which a geocoding result is reused for the same
+# address before the geocoder is called again
+GEOCODE_CACHE_TTL_DAYS = int(os.getenv('GEOCODE_CACHE_TTL_DAYS', 90))
+
+# Geocoding requests share a pool of keep-alive connections and are retried
+# with exponential backoff when the geocoder reports a transient failure
+GEOCODING_CONNECTION_POOL_SIZE = int(
+    os.getenv('GEOCODING_CONNECTION_POOL_SIZE', 10))
+GEOCODING_CONNECT_TIMEOUT_SECONDS = float(
+    os.getenv('GEOCODING_CONNECT_TIMEOUT_SECONDS', 3.05))
+GEOCODING_READ_TIMEOUT_SECONDS = float(
+    os.getenv('GEOCODING_READ_TIMEOUT_SECONDS', 10))
+GEOCODING_MAX_RETRIES = int(os.getenv('GEOCODING_MAX_RETRIES', 4))
+GEOCODING_BACKOFF_SECONDS = float(os.getenv('GEOCODING_BACKOFF_SECONDS', 0.5))
+GEOCODING_MAX_BACKOFF_SECONDS = float(
+    os.getenv('GEOCODING_MAX_BACKOFF_SECONDS', 8))
+
+# The rate of geocoding requests allowed across all workers, which should
+# match the Geocoding API quota, and the number of requests each geocoding
+# job keeps in flight. A rate of 0 disables the limit.
+GEOCODING_REQUESTS_PER_SECOND = float(
+    os.getenv('GEOCODING_REQUESTS_PER_SECOND', 50))
+GEOCODING_CONCURRENCY = int(os.getenv('GEOCODING_CONCURRENCY', 10))
 
 GOOGLE_GEOCODING_API_KEY = os.getenv('GOOGLE_GEOCODING_API_KEY')
 if GOOGLE_GEOCODING_API_KEY is None:
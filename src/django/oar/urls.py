@@ -34,6 +34,8 @@ router.register('facilities', views.FacilitiesViewSet, 'facility')
 urlpatterns = [
     url(r'^', include('django.contrib.auth.urls')),
     url(r'^web/environment\.js', environment, name='environment'),
+    url(r'^api/facilities/tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$',
+        views.facility_vector_tile, name='facility_vector_tile'),
     url(r'^api/', include(router.urls)),
     path('admin/', admin.site.urls),
     re_path(r'^health-check/', include('watchman.urls')),